@@ -0,0 +1,78 @@
+"""
+Benchmark the memory used per recorded answer
+
+Compares the previous layout (a dict with a datetime per answer) with the
+slotted AnswerRecord used by GameStateManager.record_answer.
+
+Usage: python benchmarks/bench_answer_memory.py
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_bot.game_state import AnswerRecord
+
+ANSWERS = 100000
+QUESTIONS = 20
+VARIANTS_PER_QUESTION = 4
+
+
+def answer_ids(index: int):
+    """Build fresh ID strings the way they come out of protobuf messages"""
+    question = index % QUESTIONS
+    variant = index % VARIANTS_PER_QUESTION
+    return "question-{:032d}".format(question), "variant-{:032d}-{}".format(question, variant)
+
+
+def dict_answers():
+    answers = []
+    for index in range(ANSWERS):
+        question_id, variant_id = answer_ids(index)
+        answers.append({
+            "question_id": question_id,
+            "variant_id": variant_id,
+            "is_correct": index % 2 == 0,
+            "points": 10,
+            "timestamp": datetime.now()
+        })
+    return answers
+
+
+def record_answers():
+    answers = []
+    for index in range(ANSWERS):
+        question_id, variant_id = answer_ids(index)
+        answers.append(AnswerRecord(
+            sys.intern(question_id), sys.intern(variant_id),
+            index % 2 == 0, 10, time.monotonic_ns()
+        ))
+    return answers
+
+
+def measure(build) -> float:
+    """Return the bytes retained per answer by the list build() returns"""
+    tracemalloc.start()
+    answers = build()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(answers) == ANSWERS
+    return retained / ANSWERS
+
+
+def main():
+    dict_bytes = measure(dict_answers)
+    record_bytes = measure(record_answers)
+    print("{:<14}  {:>14}".format("layout", "bytes/answer"))
+    print("{:<14}  {:>14.1f}".format("dict", dict_bytes))
+    print("{:<14}  {:>14.1f}".format("AnswerRecord", record_bytes))
+    print("saving: {:.0%}".format(1 - record_bytes / dict_bytes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Benchmark suite for GameStateManager operations
+
+Runs create_session, add_player_to_session, record_answer,
+advance_question, get_session_results and remove_session over 1k, 10k and
+100k sessions and reports ops/sec and the peak memory each operation
+allocated on top of what was already in use. Results can be saved as JSON
+and compared against a stored baseline; the comparison fails if an
+operation got slower or used more memory than the tolerance allows.
+
+Baselines are machine specific, refresh benchmarks/baseline.json with
+--update-baseline when changing machines.
+
+Usage:
+    python benchmarks/bench_game_state.py
+    python benchmarks/bench_game_state.py --sizes 1000 10000 --output results.json
+    python benchmarks/bench_game_state.py --update-baseline
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_bot.game_state import GameStateManager
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SESSION_COUNTS = [1000, 10000, 100000]
+PLAYERS_PER_SESSION = 4
+QUESTIONS = 10
+# Memory growth below this is noise, whatever the relative change
+MEMORY_SLACK_BYTES = 64 * 1024
+OPERATIONS = [
+    "create_session", "add_player_to_session", "record_answer",
+    "advance_question", "get_session_results", "remove_session",
+]
+
+
+def build_steps(manager: GameStateManager, session_count: int) -> List[Callable[[], int]]:
+    """Build one callable per operation, each running it over every session and returning the call count"""
+    session_ids = ["session-{}".format(index) for index in range(session_count)]
+    questions = [SimpleNamespace(id="question-{}".format(index)) for index in range(QUESTIONS)]
+
+    def create_sessions():
+        for game_session_id in session_ids:
+            manager.create_session(game_session_id, "pack")
+        return session_count
+
+    def add_players():
+        for session_index, game_session_id in enumerate(session_ids):
+            for player_index in range(PLAYERS_PER_SESSION):
+                telegram_user_id = session_index * PLAYERS_PER_SESSION + player_index
+                manager.add_player_to_session(
+                    game_session_id, telegram_user_id, "player-{}".format(telegram_user_id), "Player"
+                )
+        # Not measured: the game has to be running for the next operations
+        for game_session_id in session_ids:
+            manager.set_session_questions(game_session_id, questions)
+            manager.start_session(game_session_id)
+        return session_count * PLAYERS_PER_SESSION
+
+    def record_answers():
+        for session_index, game_session_id in enumerate(session_ids):
+            for player_index in range(PLAYERS_PER_SESSION):
+                manager.record_answer(
+                    game_session_id, session_index * PLAYERS_PER_SESSION + player_index,
+                    "question-0", "variant-{}".format(player_index), player_index == 0, 10
+                )
+        return session_count * PLAYERS_PER_SESSION
+
+    def advance_questions():
+        for game_session_id in session_ids:
+            manager.advance_question(game_session_id)
+        return session_count
+
+    def get_results():
+        for game_session_id in session_ids:
+            manager.get_session_results(game_session_id)
+        return session_count
+
+    def remove_sessions():
+        for game_session_id in session_ids:
+            manager.remove_session(game_session_id)
+        return session_count
+
+    return [create_sessions, add_players, record_answers, advance_questions, get_results, remove_sessions]
+
+
+def time_operations(session_count: int) -> Dict[str, float]:
+    """Run every operation once, returning ops/sec per operation"""
+    manager = GameStateManager()
+    ops_per_sec = {}
+    gc.collect()
+    # Like timeit, keep collector pauses out of the timings
+    gc.disable()
+    try:
+        for name, step in zip(OPERATIONS, build_steps(manager, session_count)):
+            start = time.perf_counter()
+            calls = step()
+            ops_per_sec[name] = calls / (time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return ops_per_sec
+
+
+def measure_memory(session_count: int) -> Dict[str, int]:
+    """Run every operation once under tracemalloc, returning the peak bytes each one allocated"""
+    manager = GameStateManager()
+    peaks = {}
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for name, step in zip(OPERATIONS, build_steps(manager, session_count)):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            step()
+            peaks[name] = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def run_suite(sizes: List[int], repeat: int) -> dict:
+    results = {}
+    for session_count in sizes:
+        # Best of several runs to keep the noise out of the comparison. Every
+        # size gets about as many timed operations as the largest one, a 1k
+        # run takes a few milliseconds and a single scheduler hiccup skews it
+        runs = [
+            time_operations(session_count)
+            for _ in range(repeat * max(1, max(SESSION_COUNTS) // session_count))
+        ]
+        peaks = measure_memory(session_count)
+        results[str(session_count)] = {
+            name: {
+                "ops_per_sec": round(max(run[name] for run in runs), 1),
+                "peak_memory_bytes": peaks[name],
+            }
+            for name in OPERATIONS
+        }
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Print the report next to the baseline and return the regressions"""
+    regressions = []
+    print("{:>8}  {:<22} {:>12} {:>8} {:>12} {:>8}".format(
+        "sessions", "operation", "ops/sec", "change", "peak KiB", "change"
+    ))
+    for size, operations in report["results"].items():
+        for name, result in operations.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            speed_change = memory_change = ""
+            if base:
+                speed = result["ops_per_sec"] / base["ops_per_sec"] - 1
+                memory = result["peak_memory_bytes"] / max(base["peak_memory_bytes"], 1) - 1
+                speed_change = "{:+.0%}".format(speed)
+                memory_change = "{:+.0%}".format(memory)
+                if speed < -tolerance:
+                    regressions.append("{} @ {}: {} ops/sec".format(name, size, speed_change))
+                if (memory > tolerance
+                        and result["peak_memory_bytes"] - base["peak_memory_bytes"] > MEMORY_SLACK_BYTES):
+                    regressions.append("{} @ {}: {} peak memory".format(name, size, memory_change))
+            print("{:>8}  {:<22} {:>12,.0f} {:>8} {:>12,.0f} {:>8}".format(
+                size, name, result["ops_per_sec"], speed_change,
+                result["peak_memory_bytes"] / 1024, memory_change
+            ))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SESSION_COUNTS, help="session counts to run")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="timed runs per size (more for small sizes), the best one counts")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON results to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="allowed fractional slowdown or memory growth before failing")
+    args = parser.parse_args()
+
+    report = run_suite(args.sizes, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Saved baseline to {}".format(args.baseline))
+    elif not baseline:
+        print("No baseline at {}, run with --update-baseline to create one".format(args.baseline))
+
+    if regressions:
+        print("\nRegressions beyond {:.0%}:".format(args.tolerance))
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
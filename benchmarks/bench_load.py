@@ -0,0 +1,366 @@
+"""
+Load test of the whole bot against a fake backend and a fake Telegram
+
+Everything runs in one process:
+    - an in-process grpc.aio QuizService answering every RPC after a
+      configurable latency,
+    - the fake Bot API from fake_telegram.py, receiving the bot's messages,
+    - the bot itself, fed updates straight into its update queue,
+    - a driver playing N concurrent games of M players through /newgame,
+      pack selection, /join, "Start Game" and the answer buttons.
+
+Each step is timed from queuing the update to the bot's reply reaching the
+fake Bot API. Players join their game with the join code its creator got,
+so every game runs concurrently from the first step.
+
+Requires the generated proto modules (./generate_proto.sh).
+
+Usage: python benchmarks/bench_load.py --games 20 --players 5 --questions 5 --latency-ms 5
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_telegram import FakeTelegram, make_callback_update, make_handler, make_update
+
+PACK_TITLE = "Load Test Pack"
+VARIANTS_PER_QUESTION = 4
+
+
+def _fill(message, **fields):
+    """Set the fields the message type actually has, whatever the proto version"""
+    for name, value in fields.items():
+        if name in message.DESCRIPTOR.fields_by_name:
+            setattr(message, name, value)
+    return message
+
+
+def make_servicer(cruds_pb2, cruds_pb2_grpc, latency: float, questions: int):
+    """Build a fake QuizService that keeps its state in memory"""
+
+    class FakeQuizService(cruds_pb2_grpc.QuizServiceServicer):
+        def __init__(self):
+            self.ids = itertools.count(1)
+            self.players: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+
+        async def _delay(self):
+            if latency:
+                await asyncio.sleep(latency * random.uniform(0.5, 1.5))
+
+        async def GetAllPacks(self, request, context):
+            await self._delay()
+            response = cruds_pb2.GetAllPacksResponse()
+            _fill(response.packs.add(), id="pack-1", title=PACK_TITLE)
+            return response
+
+        async def GetQuestionsByPackId(self, request, context):
+            await self._delay()
+            response = cruds_pb2.GetQuestionsByPackIdResponse()
+            for index in range(questions):
+                _fill(response.questions.add(), id="q{}".format(index + 1),
+                      text="Question {} of the load test?".format(index + 1))
+            return response
+
+        async def GetVariantsByQuestionId(self, request, context):
+            await self._delay()
+            response = cruds_pb2.GetVariantsByQuestionIdResponse()
+            for index in range(VARIANTS_PER_QUESTION):
+                # Texts are unique per question so a late answer can't hit the next one
+                _fill(response.variants.add(), id="{}-v{}".format(request.question_id, index),
+                      text="{} answer {}".format(request.question_id, index + 1), is_correct=index == 0)
+            return response
+
+        async def CreateGameSession(self, request, context):
+            await self._delay()
+            response = cruds_pb2.CreateGameSessionResponse()
+            _fill(response.game_session, id="session-{}".format(next(self.ids)), pack_id=request.pack_id)
+            return response
+
+        async def _session_response(self, response_class, request):
+            await self._delay()
+            response = response_class()
+            _fill(response.game_session, id=request.id)
+            return response
+
+        async def GetGameSession(self, request, context):
+            return await self._session_response(cruds_pb2.GetGameSessionResponse, request)
+
+        async def StartGameSession(self, request, context):
+            return await self._session_response(cruds_pb2.StartGameSessionResponse, request)
+
+        async def EndGameSession(self, request, context):
+            return await self._session_response(cruds_pb2.EndGameSessionResponse, request)
+
+        async def AddPlayer(self, request, context):
+            await self._delay()
+            player_id = "player-{}".format(next(self.ids))
+            self.players[request.game_session_id].append((player_id, request.name))
+            response = cruds_pb2.AddPlayerResponse()
+            _fill(response.player, id=player_id, name=request.name)
+            return response
+
+        async def GetPlayers(self, request, context):
+            await self._delay()
+            response = cruds_pb2.GetPlayersResponse()
+            for player_id, name in self.players[request.game_session_id]:
+                _fill(response.players.add(), id=player_id, name=name)
+            return response
+
+        async def SubmitAnswer(self, request, context):
+            await self._delay()
+            is_correct = request.variant_id.endswith("-v0")
+            return _fill(cruds_pb2.SubmitAnswerResponse(), is_correct=is_correct, points=10 if is_correct else 0)
+
+        async def GetPlayerAnswers(self, request, context):
+            await self._delay()
+            return cruds_pb2.GetPlayerAnswersResponse()
+
+    return FakeQuizService()
+
+
+class Inbox:
+    """Messages the bot sent, per chat, for the driver to wait on"""
+
+    def __init__(self):
+        self.messages: Dict[int, List[Tuple[float, str, Any]]] = defaultdict(list)
+        self._events: Dict[int, asyncio.Event] = {}
+
+    def deliver(self, chat_id: int, arrived_at: float, text: str, reply_markup: Any):
+        self.messages[chat_id].append((arrived_at, text, reply_markup))
+        event = self._events.pop(chat_id, None)
+        if event is not None:
+            event.set()
+
+    def mark(self, chat_id: int) -> int:
+        return len(self.messages[chat_id])
+
+    async def wait_for(self, chat_id: int, predicate: Callable[[str], bool],
+                       since: int = 0) -> Tuple[float, str, Any]:
+        """Wait for the first message to chat_id from index since on that matches predicate"""
+        index = since
+        while True:
+            messages = self.messages[chat_id]
+            while index < len(messages):
+                if predicate(messages[index][1]):
+                    return messages[index]
+                index += 1
+            await self._events.setdefault(chat_id, asyncio.Event()).wait()
+
+
+class RecordingTelegram(FakeTelegram):
+    """Fake Bot API that hands every message the bot sends to an Inbox"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, inbox: Inbox):
+        super().__init__()
+        self.loop = loop
+        self.inbox = inbox
+
+    def record_message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        message = super().record_message(params)
+        reply_markup = params.get("reply_markup")
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+        self.loop.call_soon_threadsafe(
+            self.inbox.deliver, message["chat"]["id"], time.perf_counter(), message["text"], reply_markup
+        )
+        return message
+
+
+def contains(text: str) -> Callable[[str], bool]:
+    return lambda message: text in message
+
+
+def is_feedback(message: str) -> bool:
+    # The bot edits the outcome of an answer into the question message
+    return "\n\nYour answer: " in message or "\n\n⌛" in message
+
+
+def answer_options(reply_markup: Any) -> List[str]:
+    """Get the callback data of the answer buttons under a question"""
+    return [
+        button["callback_data"]
+        for row in (reply_markup or {}).get("inline_keyboard", [])
+        for button in row
+        if button["text"] != "Leave Game"
+    ]
+
+
+class Driver:
+    """Plays games against the bot and records the latency of every step"""
+
+    def __init__(self, application, inbox: Inbox, questions: int, timeout: float):
+        self.application = application
+        self.inbox = inbox
+        self.questions = questions
+        self.timeout = timeout
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.updates_sent = 0
+        self._update_ids = itertools.count(1)
+
+    async def send(self, user_id: int, text: str, callback_data: Optional[str] = None) -> float:
+        """Send a message, or press the button with callback_data under the bot message with text"""
+        if callback_data is None:
+            data = make_update(next(self._update_ids), user_id, text, "Player{}".format(user_id))
+        else:
+            data = make_callback_update(
+                next(self._update_ids), user_id, callback_data, text, "Player{}".format(user_id)
+            )
+        sent_at = time.perf_counter()
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+        self.updates_sent += 1
+        return sent_at
+
+    async def wait_for(self, user_id: int, predicate: Callable[[str], bool], since: int = 0):
+        return await asyncio.wait_for(self.inbox.wait_for(user_id, predicate, since), self.timeout)
+
+    async def step(self, name: str, user_id: int, text: str, predicate: Callable[[str], bool],
+                   callback_data: Optional[str] = None):
+        """Send a message or press a button and wait for the reply that completes the step"""
+        since = self.inbox.mark(user_id)
+        sent_at = await self.send(user_id, text, callback_data)
+        arrived_at, reply, reply_markup = await self.wait_for(user_id, predicate, since)
+        self.latencies[name].append(arrived_at - sent_at)
+        return reply, reply_markup
+
+    async def play_game(self, game_index: int, players: int):
+        user_ids = [1 + game_index * players + index for index in range(players)]
+        creator = user_ids[0]
+
+        await self.step("newgame", creator, "/newgame", contains("Choose a quiz pack"))
+        lobby, _ = await self.step("select_pack", creator, PACK_TITLE, contains("New Game Created"))
+        join_code = re.search(r"Join code: (\w+)", lobby).group(1)
+        await asyncio.gather(*(
+            self.step("join", user_id, "/join " + join_code, contains("Player{} has joined".format(user_id)))
+            for user_id in user_ids[1:]
+        ))
+        await self.step("start_game", creator, "Start Game", contains("Question 1/"))
+        # Results latency counts from the last round of answers, or from the start without questions
+        round_started = time.perf_counter()
+
+        for question_number in range(1, self.questions + 1):
+            # Everyone answers once the question reached them
+            question_messages = await asyncio.gather(*(
+                self.wait_for(user_id, contains("Question {}/".format(question_number)))
+                for user_id in user_ids
+            ))
+            if question_number > 1:
+                for arrived_at, _, _ in question_messages:
+                    self.latencies["next_question"].append(arrived_at - round_started)
+
+            round_started = time.perf_counter()
+            await asyncio.gather(*(
+                self.step("answer", user_id, question, is_feedback, random.choice(answer_options(reply_markup)))
+                for user_id, (_, question, reply_markup) in zip(user_ids, question_messages)
+            ))
+
+        results = await asyncio.gather(*(self.wait_for(user_id, contains("Game Over")) for user_id in user_ids))
+        for arrived_at, _, _ in results:
+            self.latencies["results"].append(arrived_at - round_started)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args) -> bool:
+    # The bot reads its endpoints from the environment when its config is imported
+    os.environ["BACKEND_GRPC_ADDRESSES"] = "127.0.0.1:{}".format(args.backend_port)
+    os.environ["TELEGRAM_API_BASE_URL"] = "http://127.0.0.1:{}/bot".format(args.telegram_port)
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:load-test")
+
+    import logging
+    import grpc.aio
+    from game_bot import bot
+    from game_bot.broadcast import Broadcaster
+    from game_bot.proto_loader import load_proto_modules
+
+    logging.getLogger().setLevel(logging.WARNING)
+    cruds_pb2, cruds_pb2_grpc, _, _ = load_proto_modules()
+
+    server = grpc.aio.server()
+    cruds_pb2_grpc.add_QuizServiceServicer_to_server(
+        make_servicer(cruds_pb2, cruds_pb2_grpc, args.latency_ms / 1000, args.questions), server
+    )
+    server.add_insecure_port("127.0.0.1:{}".format(args.backend_port))
+    await server.start()
+
+    inbox = Inbox()
+    telegram = RecordingTelegram(asyncio.get_running_loop(), inbox)
+    http_server = ThreadingHTTPServer(("127.0.0.1", args.telegram_port), make_handler(telegram))
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+
+    bot.broadcaster = Broadcaster(args.global_rate, args.per_chat_rate, args.per_chat_rate * 3, 3)
+    application = bot.build_application(with_updater=False)
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+
+        driver = Driver(application, inbox, args.questions, args.timeout)
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(driver.play_game(game_index, args.players) for game_index in range(args.games)),
+            return_exceptions=True
+        )
+        elapsed = time.perf_counter() - start
+
+        await application.stop()
+        await bot.post_shutdown(application)
+
+    http_server.shutdown()
+    await server.stop(None)
+
+    failures = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    print("games:      {} x {} players x {} questions ({} failed)".format(
+        args.games, args.players, args.questions, len(failures)
+    ))
+    print("elapsed:    {:.3f}s".format(elapsed))
+    print("throughput: {:.1f} updates/s, {:.1f} messages/s sent by the bot".format(
+        driver.updates_sent / elapsed, len(telegram.sent_messages) / elapsed
+    ))
+    print("{:<14} {:>7} {:>10} {:>10}".format("step", "count", "p50 ms", "p99 ms"))
+    for name in ("newgame", "select_pack", "join", "start_game", "answer", "next_question", "results"):
+        values = driver.latencies.get(name)
+        if values:
+            print("{:<14} {:>7} {:>10.2f} {:>10.2f}".format(
+                name, len(values), percentile(values, 0.5) * 1000, percentile(values, 0.99) * 1000
+            ))
+    for failure in failures[:3]:
+        print("failure: {!r}".format(failure))
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--players", type=int, default=5, help="players per game, including the creator")
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=5, help="mean latency of every fake backend RPC")
+    parser.add_argument("--global-rate", type=float, default=30, help="bot messages per second across chats")
+    parser.add_argument("--per-chat-rate", type=float, default=1, help="bot messages per second to one chat")
+    parser.add_argument("--backend-port", type=int, default=50151)
+    parser.add_argument("--telegram-port", type=int, default=8091)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for any single reply")
+    args = parser.parse_args()
+    if not asyncio.run(run(args)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
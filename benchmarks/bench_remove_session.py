@@ -0,0 +1,58 @@
+"""
+Benchmark game session teardown as the number of online users grows
+
+Usage: python benchmarks/bench_remove_session.py
+"""
+
+import os
+import sys
+import time
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_bot.game_state import GameStateManager
+
+PLAYERS_PER_SESSION = 4
+TEARDOWNS = 1000
+USER_COUNTS = [1000, 10000, 100000]
+
+
+def build_manager(user_count: int) -> GameStateManager:
+    """Create a manager with user_count users spread over sessions"""
+    manager = GameStateManager()
+    for session_index in range(user_count // PLAYERS_PER_SESSION):
+        game_session_id = "session-{}".format(session_index)
+        manager.create_session(game_session_id, "pack")
+        for player_index in range(PLAYERS_PER_SESSION):
+            telegram_user_id = session_index * PLAYERS_PER_SESSION + player_index
+            manager.add_player_to_session(
+                game_session_id, telegram_user_id,
+                "player-{}".format(telegram_user_id), "Player {}".format(telegram_user_id)
+            )
+    return manager
+
+
+def bench_teardown(user_count: int) -> float:
+    """Return the mean time of one remove_session call in microseconds"""
+    manager = build_manager(user_count)
+    session_ids = list(manager.sessions)[:TEARDOWNS]
+
+    start = time.perf_counter()
+    for game_session_id in session_ids:
+        manager.remove_session(game_session_id)
+    elapsed = time.perf_counter() - start
+
+    removed = set(session_ids)
+    assert not any(session_id in removed for session_id in manager.user_sessions.values())
+    return elapsed / len(session_ids) * 1e6
+
+
+def main():
+    print("{:>10}  {:>14}".format("users", "teardown (us)"))
+    for user_count in USER_COUNTS:
+        print("{:>10}  {:>14.2f}".format(user_count, bench_teardown(user_count)))
+
+
+if __name__ == "__main__":
+    main()
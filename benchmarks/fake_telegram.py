@@ -0,0 +1,247 @@
+"""
+Fake Telegram Bot API for measuring update throughput
+
+Serves the handful of Bot API methods the bot uses and feeds it synthetic
+/start updates, either through getUpdates (polling mode) or by POSTing
+them to the bot's webhook (webhook mode). Throughput is measured from the
+first update handed out to the last reply the bot sends back.
+
+Usage:
+    1. Point the bot at the fake API in config.yaml:
+           telegram:
+             api_base_url: "http://127.0.0.1:8090/bot"
+       and select telegram.mode (polling or webhook).
+    2. Start the harness, then the bot:
+           python benchmarks/fake_telegram.py --mode polling --updates 5000
+           python benchmarks/fake_telegram.py --mode webhook --updates 5000 \\
+               --webhook-url http://127.0.0.1:8443/telegram --secret-token <secret>
+           python main.py
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+BOT_USER = {
+    "id": 1000000,
+    "is_bot": True,
+    "first_name": "Quiz Bot",
+    "username": "fake_quiz_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+def make_update(update_id: int, user_id: int, text: str, first_name: str = "Player") -> Dict[str, Any]:
+    """Build a private chat message update"""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": first_name},
+        "from": {"id": user_id, "is_bot": False, "first_name": first_name},
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+def make_callback_update(update_id: int, user_id: int, data: str, message_text: str,
+                         first_name: str = "Player") -> Dict[str, Any]:
+    """Build a press of an inline keyboard button under a bot message with message_text"""
+    user = {"id": user_id, "is_bot": False, "first_name": first_name}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": first_name},
+        "from": BOT_USER,
+        "text": message_text,
+    }
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": str(user_id), "message": message, "data": data,
+        },
+    }
+
+
+class FakeTelegram:
+    """State shared by the fake Bot API request handlers"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending_updates: List[Dict[str, Any]] = []
+        self.sent_messages: List[Dict[str, Any]] = []
+        self.webhook_url: Optional[str] = None
+        self.first_update_at: Optional[float] = None
+        self.last_reply_at: Optional[float] = None
+        self._message_id = 0
+
+    def push_updates(self, updates: List[Dict[str, Any]]):
+        """Queue updates for getUpdates"""
+        with self.condition:
+            self.pending_updates.extend(updates)
+            self.condition.notify_all()
+
+    def get_updates(self, offset: int, timeout: float) -> List[Dict[str, Any]]:
+        with self.condition:
+            self.pending_updates = [u for u in self.pending_updates if u["update_id"] >= offset]
+            if not self.pending_updates:
+                self.condition.wait(timeout)
+            updates = self.pending_updates[:100]
+            if updates and self.first_update_at is None:
+                self.first_update_at = time.perf_counter()
+            return updates
+
+    def record_message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        with self.condition:
+            self._message_id += 1
+            message = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+            self.sent_messages.append(message)
+            self.last_reply_at = time.perf_counter()
+            self.condition.notify_all()
+            return message
+
+    def wait_for_replies(self, count: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while len(self.sent_messages) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def wait_for_webhook(self, timeout: float) -> Optional[str]:
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.webhook_url is None and time.monotonic() < deadline:
+                self.condition.wait(deadline - time.monotonic())
+            return self.webhook_url
+
+    def dispatch(self, method: str, params: Dict[str, Any]) -> Any:
+        """Handle a Bot API method call and return its result"""
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return self.get_updates(int(params.get("offset", 0)), float(params.get("timeout", 0)))
+        if method == "setWebhook":
+            with self.condition:
+                self.webhook_url = params.get("url")
+                self.condition.notify_all()
+            return True
+        if method in ("sendMessage", "editMessageText"):
+            return self.record_message(params)
+        # deleteWebhook, answerCallbackQuery, close, logOut, ...
+        return True
+
+
+def make_handler(telegram: FakeTelegram):
+    class BotApiHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            method = self.path.rsplit("/", 1)[-1]
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            result = telegram.dispatch(method, self._parse_params(body))
+            payload = json.dumps({"ok": True, "result": result}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST
+
+        def _parse_params(self, body: bytes) -> Dict[str, Any]:
+            if not body:
+                return {}
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                return json.loads(body)
+            # Form encoded, complex values are JSON encoded strings
+            params = {}
+            for key, values in urllib.parse.parse_qs(body.decode("utf-8")).items():
+                try:
+                    params[key] = json.loads(values[0])
+                except ValueError:
+                    params[key] = values[0]
+            return params
+
+        def log_message(self, format, *args):
+            pass
+
+    return BotApiHandler
+
+
+def post_webhook(url: str, update: Dict[str, Any], secret_token: Optional[str]):
+    headers = {"Content-Type": "application/json"}
+    if secret_token:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret_token
+    request = urllib.request.Request(url, json.dumps(update).encode("utf-8"), headers)
+    urllib.request.urlopen(request).read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=100, help="distinct users sending updates")
+    parser.add_argument("--webhook-url", help="defaults to the URL the bot registers with setWebhook")
+    parser.add_argument("--secret-token")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel webhook POSTs")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    telegram = FakeTelegram()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(telegram))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print("Fake Bot API listening on http://{}:{}/bot<token>".format(args.host, args.port))
+
+    updates = [
+        make_update(update_id, 1 + update_id % args.users, "/start")
+        for update_id in range(1, args.updates + 1)
+    ]
+
+    if args.mode == "polling":
+        print("Waiting for the bot to poll...")
+        telegram.push_updates(updates)
+    else:
+        webhook_url = args.webhook_url or telegram.wait_for_webhook(args.timeout)
+        if not webhook_url:
+            print("The bot never registered a webhook")
+            sys.exit(1)
+        print("Posting updates to {}".format(webhook_url))
+        telegram.first_update_at = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            for update in updates:
+                executor.submit(post_webhook, webhook_url, update, args.secret_token)
+
+    if not telegram.wait_for_replies(args.updates, args.timeout):
+        print("Timed out after {} of {} replies".format(len(telegram.sent_messages), args.updates))
+        sys.exit(1)
+
+    elapsed = telegram.last_reply_at - telegram.first_update_at
+    print("mode: {}".format(args.mode))
+    print("updates: {}".format(args.updates))
+    print("elapsed: {:.3f}s".format(elapsed))
+    print("throughput: {:.1f} updates/s".format(args.updates / elapsed))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Stress test for per-session answer ordering
+
+Every player of every session answers the current question at the same
+moment, thousands of answers in flight at once. The answer pipeline
+mirrors handle_answer: take the session lock, check the question is still
+current, await a slow SubmitAnswer, record the answer and advance. Exactly
+one answer per question may be accepted and every session must advance
+exactly once per round.
+
+Usage: python benchmarks/stress_session_locks.py [--no-lock]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_bot.game_state import GameStateManager
+
+SESSIONS = 100
+PLAYERS_PER_SESSION = 20
+QUESTIONS = 10
+SUBMIT_LATENCY = 0.005
+
+
+async def submit_answer():
+    """Stand-in for the SubmitAnswer RPC"""
+    await asyncio.sleep(SUBMIT_LATENCY * random.uniform(0.5, 1.5))
+    return SimpleNamespace(is_correct=True, points=10)
+
+
+async def apply_answer(manager: GameStateManager, game_session_id: str, telegram_user_id: int,
+                       question_id: str, use_lock: bool) -> bool:
+    """Apply one answer the way handle_answer does, returning whether it was accepted"""
+    lock = manager.session_lock(game_session_id) if use_lock else contextlib.nullcontext()
+    async with lock:
+        current_question = manager.get_current_question(game_session_id)
+        if not current_question or current_question.id != question_id:
+            return False
+        response = await submit_answer()
+        manager.record_answer(
+            game_session_id, telegram_user_id, question_id, "variant",
+            response.is_correct, response.points
+        )
+        manager.advance_question(game_session_id)
+        return True
+
+
+async def run(use_lock: bool):
+    manager = GameStateManager()
+    for session_index in range(SESSIONS):
+        game_session_id = "session-{}".format(session_index)
+        manager.create_session(game_session_id, "pack")
+        for player_index in range(PLAYERS_PER_SESSION):
+            telegram_user_id = session_index * PLAYERS_PER_SESSION + player_index
+            manager.add_player_to_session(game_session_id, telegram_user_id, str(telegram_user_id), "Player")
+        # One extra question so advance_question succeeds after every round
+        manager.set_session_questions(game_session_id, [
+            SimpleNamespace(id="q{}".format(index)) for index in range(QUESTIONS + 1)
+        ])
+        manager.start_session(game_session_id)
+
+    accepted = 0
+    start = time.perf_counter()
+    for _ in range(QUESTIONS):
+        answers = []
+        for game_session_id, session in manager.sessions.items():
+            question_id = manager.get_current_question(game_session_id).id
+            for telegram_user_id in session.players:
+                answers.append(apply_answer(manager, game_session_id, telegram_user_id, question_id, use_lock))
+        random.shuffle(answers)
+        accepted += sum(await asyncio.gather(*answers))
+    elapsed = time.perf_counter() - start
+
+    total = SESSIONS * PLAYERS_PER_SESSION * QUESTIONS
+    indexes = {session.current_question_index for session in manager.sessions.values()}
+    recorded = sum(len(player.answers) for session in manager.sessions.values() for player in session.players.values())
+    print("answers fired:    {}".format(total))
+    print("answers accepted: {} (expected {})".format(accepted, SESSIONS * QUESTIONS))
+    print("question indexes: {} (expected {{{}}})".format(sorted(indexes), QUESTIONS))
+    print("elapsed:          {:.3f}s ({:.0f} answers/s)".format(elapsed, total / elapsed))
+    print("locks left:       {}".format(len(manager.session_locks)))
+
+    ok = accepted == recorded == SESSIONS * QUESTIONS and indexes == {QUESTIONS} and not manager.session_locks
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test per-session answer ordering")
+    parser.add_argument("--no-lock", action="store_true", help="skip the session lock to show the race")
+    args = parser.parse_args()
+    if not asyncio.run(run(use_lock=not args.no_lock)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Coalescing of SubmitAnswer calls, a hook for a future batch RPC
+"""
+
+import asyncio
+import contextvars
+import logging
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class AnswerSubmissionBatcher:
+    """Coalesces answer submissions made within a short window
+
+    Callers await submit_answer() as if it were the RPC itself. Submissions
+    are queued and, once the window has passed or max_batch_size answers are
+    waiting, flushed together. Each caller gets back the response of its own
+    answer.
+
+    The backend has no batch RPC yet, so a flush still sends one SubmitAnswer
+    per answer and the window only adds latency. With a window of 0 (the
+    default) answers go straight through; the queue is here so a batch RPC
+    can be plugged into _send() once the service offers one.
+    """
+
+    def __init__(self, submit: Callable[[str, str, str], Awaitable[Optional[object]]],
+                 window: float, max_batch_size: int):
+        self._submit = submit
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[Tuple[str, str, str], asyncio.Future, contextvars.Context]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit_answer(self, player_id: str, question_id: str, variant_id: str) -> Optional[object]:
+        """Queue an answer and wait for the backend's response to it"""
+        if self.window <= 0:
+            return await self._submit(player_id, question_id, variant_id)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Keep the caller's context so the RPC is traced as part of its handler
+        self._pending.append(((player_id, question_id, variant_id), future, contextvars.copy_context()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[Tuple[str, str, str], asyncio.Future, contextvars.Context]]):
+        responses = await asyncio.gather(
+            *(context.run(asyncio.ensure_future, self._submit(*answer)) for answer, _, context in batch),
+            return_exceptions=True
+        )
+        logger.debug("Submitted a batch of {} answers".format(len(batch)))
+        for (_, future, _), response in zip(batch, responses):
+            if future.done():
+                # The caller gave up waiting
+                continue
+            if isinstance(response, BaseException):
+                future.set_exception(response)
+            else:
+                future.set_result(response)
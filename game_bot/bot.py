@@ -2,57 +2,289 @@
 Main Telegram bot implementation for the quiz game
 """
 
+import asyncio
 import logging
-import sys
-import os
+import time
+from typing import Dict, List, Optional, Set
+from telegram import (
+    CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup,
+    Update, ReplyKeyboardMarkup, ReplyKeyboardRemove,
+)
+from telegram.error import TelegramError
+from telegram.ext import (
+    Application, CallbackContext, CallbackQueryHandler, CommandHandler, MessageHandler,
+    filters, ContextTypes,
+)
 
-# Add the current directory to the path so we can import proto modules
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-from typing import Dict, List, Optional
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-
-from game_bot.config import TELEGRAM_BOT_TOKEN, POINTS_PER_CORRECT_ANSWER
-
-# Import the gRPC client
-try:
-    from game_bot.grpc_client import GameServiceClient
-    # We'll initialize the gRPC client when needed
-    grpc_client = None
-except ImportError as e:
-    print("Failed to import grpc_client: {}".format(e))
-    print("Make sure you've run the proto generation script: ./generate_proto.sh")
-    sys.exit(1)
+from game_bot.config import (
+    TELEGRAM_BOT_TOKEN, POINTS_PER_CORRECT_ANSWER, OPTIMISTIC_SCORING,
+    QUESTION_TIME_LIMIT, PACK_QUESTION_TIME_LIMITS,
+    PACK_CATALOGUE_TTL, PACK_CATALOGUE_REFRESH_INTERVAL, PACK_CONTENT_MAX_PACKS,
+    STORAGE_BACKEND, STORAGE_SQLITE_PATH, STORAGE_BATCH_SIZE, STORAGE_FLUSH_INTERVAL,
+    SESSION_IDLE_TTLS, SESSION_SWEEP_INTERVAL,
+    SHARD_WORKERS, TELEGRAM_MODE, TELEGRAM_API_BASE_URL, DEFAULT_TELEGRAM_API_BASE_URL,
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL,
+    WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS,
+    BROADCAST_GLOBAL_RATE, BROADCAST_PER_CHAT_RATE, BROADCAST_PER_CHAT_BURST, BROADCAST_MAX_RETRIES,
+    SUBMIT_BATCH_WINDOW_MS, SUBMIT_BATCH_MAX_SIZE,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT,
+    TRACING_ENABLED, TRACING_PATH, TRACING_SAMPLE_RATE,
+    WATCHDOG_ENABLED, WATCHDOG_INTERVAL, WATCHDOG_BLOCKED_THRESHOLD, SLOW_HANDLER_THRESHOLD,
+    PROFILE_HANDLER, PROFILE_PATH, PROFILE_DUMP_EVERY,
+)
+from game_bot.batching import AnswerSubmissionBatcher
+from game_bot.broadcast import Broadcaster
+from game_bot.cache import PackCatalogueCache, PackContentCache
+from game_bot.metrics import Gauge, instrumented, loop_lag, registry, start_metrics_server
+from game_bot.timers import TimerScheduler
+from game_bot import tracing, watchdog
 
 from game_bot.game_state import game_state_manager, GameSessionState, PlayerState
+from game_bot.storage import SessionStore, MemorySessionStore, SQLiteSessionStore
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The gRPC client, created on first use so grpc and the proto modules stay off the startup path
+grpc_client = None
+
 
 def get_grpc_client():
     """Get or create the gRPC client instance"""
     global grpc_client
     if grpc_client is None:
         try:
-            grpc_client = GameServiceClient()
+            from game_bot.grpc_client import AsyncGameServiceClient
+            grpc_client = AsyncGameServiceClient()
         except Exception as e:
             logger.error("Failed to initialize gRPC client: {}".format(e))
             raise
     return grpc_client
 
 
+async def fetch_all_packs() -> List[object]:
+    """Fetch the pack catalogue from the backend"""
+    return await get_grpc_client().get_all_packs()
+
+
+# Pack catalogue served to /packs and /newgame
+pack_cache = PackCatalogueCache(
+    fetch_all_packs, PACK_CATALOGUE_TTL, PACK_CATALOGUE_REFRESH_INTERVAL
+)
+
+
+async def fetch_questions(pack_id: str) -> List[object]:
+    """Fetch the questions of a pack from the backend"""
+    return await get_grpc_client().get_questions_by_pack_id(pack_id)
+
+
+async def fetch_variants(question_id: str) -> List[object]:
+    """Fetch the answer variants of a question from the backend"""
+    return await get_grpc_client().get_variants_by_question_id(question_id)
+
+
+# Questions and variants of recently played packs
+pack_content_cache = PackContentCache(fetch_questions, fetch_variants, PACK_CONTENT_MAX_PACKS)
+
+
+async def submit_answer(player_id: str, question_id: str, variant_id: str) -> Optional[object]:
+    """Submit a player's answer to the backend"""
+    return await get_grpc_client().submit_answer(player_id, question_id, variant_id)
+
+
+# Coalesces answer submissions from all sessions into short batches
+answer_batcher = AnswerSubmissionBatcher(
+    submit_answer, SUBMIT_BATCH_WINDOW_MS / 1000, SUBMIT_BATCH_MAX_SIZE
+)
+
+
+# Background reconciliations of optimistically scored answers, per game session
+pending_reconciliations: Dict[str, Set[asyncio.Task]] = {}
+
+
+def track_reconciliation(game_session_id: str, task: asyncio.Task):
+    """Remember a reconciliation until it finishes so end_game can wait for it"""
+    tasks = pending_reconciliations.setdefault(game_session_id, set())
+    tasks.add(task)
+    
+    def forget(task: asyncio.Task):
+        tasks.discard(task)
+        if not tasks and pending_reconciliations.get(game_session_id) is tasks:
+            del pending_reconciliations[game_session_id]
+    
+    task.add_done_callback(forget)
+
+
+# Sends messages to every player of a session within Telegram's rate limits
+broadcaster = Broadcaster(
+    BROADCAST_GLOBAL_RATE, BROADCAST_PER_CHAT_RATE, BROADCAST_PER_CHAT_BURST, BROADCAST_MAX_RETRIES
+)
+
+
+async def broadcast_to_session(context: ContextTypes.DEFAULT_TYPE, session_state: GameSessionState,
+                               text: str, **kwargs):
+    """Send a message to every player of a game session"""
+    with tracing.start_span("broadcast", chats=len(session_state.players)):
+        # Players talk to the bot in private chats, so the chat ID is the user ID
+        return await broadcaster.broadcast(context.bot, list(session_state.players), text, **kwargs)
+
+
+# Callback data of the buttons under a question: "<action>:<join code>[:<question>:<variant>]"
+ANSWER_ACTION = "a"
+LEAVE_ACTION = "l"
+
+
+# Per-question time limits of every running game
+question_timers = TimerScheduler()
+
+
+def get_question_time_limit(pack_id: str) -> float:
+    """Seconds players get per question of a pack, 0 for no limit"""
+    return PACK_QUESTION_TIME_LIMITS.get(pack_id, QUESTION_TIME_LIMIT)
+
+
+# Live game state, read whenever the metrics are scraped
+registry.register(Gauge(
+    "game_bot_sessions", "Game sessions held by this process", ["state"],
+    lambda: {(state,): game_state_manager.count_sessions(state) for state in game_state_manager.sessions_by_state}
+))
+registry.register(Gauge(
+    "game_bot_players", "Players in game sessions held by this process", (),
+    lambda: {(): len(game_state_manager.user_sessions)}
+))
+registry.register(Gauge(
+    "game_bot_question_timers", "Question time limits waiting to run out", (),
+    lambda: {(): len(question_timers)}
+))
+
+
+async def flush_session_store():
+    """Periodically commit buffered game state changes"""
+    while True:
+        await asyncio.sleep(STORAGE_FLUSH_INTERVAL)
+        try:
+            game_state_manager.store.flush()
+        except Exception as e:
+            logger.error("Error flushing session store: {}".format(e))
+
+
+async def expire_session(application: Application, session_state: GameSessionState):
+    """End an idle game session in the backend, tell its players and drop it"""
+    game_session_id = session_state.game_session_id
+    async with game_state_manager.session_lock(game_session_id):
+        if game_state_manager.get_session(game_session_id) is not session_state:
+            return
+        # Someone may have played while we waited for the lock
+        if not game_state_manager.is_expired(session_state):
+            game_state_manager.schedule_expiry(session_state)
+            return
+        game_state_manager.remove_session(game_session_id)
+        question_timers.cancel(game_session_id)
+    
+    logger.info("Expired {} game session {}".format(session_state.state, game_session_id))
+    if session_state.state == "finished":
+        return
+    
+    try:
+        await get_grpc_client().end_game_session(game_session_id)
+    except Exception as e:
+        logger.error("Error ending expired game session: {}".format(e))
+    
+    await broadcast_to_session(
+        CallbackContext(application), session_state,
+        "⌛ The game was closed because nobody played for a while. Start a new one with /newgame",
+        reply_markup=ReplyKeyboardRemove()
+    )
+
+
+async def sweep_expired_sessions(application: Application):
+    """Periodically expire game sessions idle for longer than the TTL of their state"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        for session_state in game_state_manager.pop_expired_sessions():
+            try:
+                await expire_session(application, session_state)
+            except Exception as e:
+                logger.error("Error expiring game session {}: {}".format(session_state.game_session_id, e))
+
+
+async def warm_up():
+    """Connect to the backend and load the pack catalogue in the background"""
+    # Let startup finish before grpc and the proto modules get imported
+    await asyncio.sleep(0)
+    try:
+        await pack_cache.refresh()
+    except Exception as e:
+        logger.error("Error warming up the pack catalogue: {}".format(e))
+
+
+async def post_init(application: Application):
+    """Start background tasks once the application is initialized"""
+    pack_cache.start()
+    application.bot_data["warm_up_task"] = asyncio.create_task(warm_up())
+    application.bot_data["store_flush_task"] = asyncio.create_task(flush_session_store())
+    game_state_manager.set_idle_ttls(SESSION_IDLE_TTLS)
+    # Give games restored from the session store their current question's time again
+    for session_state in game_state_manager.get_sessions_by_state("active"):
+        schedule_question_timeout(application, session_state)
+    application.bot_data["expiry_sweep_task"] = asyncio.create_task(sweep_expired_sessions(application))
+    if METRICS_ENABLED:
+        port = application.bot_data.get("metrics_port", METRICS_PORT)
+        application.bot_data["metrics_server"] = await start_metrics_server(METRICS_HOST, port)
+    if TRACING_ENABLED:
+        path = application.bot_data.get("trace_path", TRACING_PATH)
+        tracing.configure(tracing.JsonLinesExporter(path), TRACING_SAMPLE_RATE)
+    if WATCHDOG_ENABLED:
+        loop_watchdog = watchdog.LoopWatchdog(WATCHDOG_INTERVAL, WATCHDOG_BLOCKED_THRESHOLD, loop_lag.observe)
+        loop_watchdog.start()
+        application.bot_data["loop_watchdog"] = loop_watchdog
+    profiler = None
+    if PROFILE_HANDLER:
+        path = application.bot_data.get("profile_path", PROFILE_PATH)
+        profiler = watchdog.HandlerProfiler(PROFILE_HANDLER, path, PROFILE_DUMP_EVERY)
+    watchdog.configure(SLOW_HANDLER_THRESHOLD, profiler)
+    started_at = application.bot_data.get("started_at")
+    if started_at is not None:
+        logger.info("Initialized {:.3f}s after startup".format(time.perf_counter() - started_at))
+
+
+async def post_shutdown(application: Application):
+    """Stop background tasks and close the gRPC channel on shutdown"""
+    global grpc_client
+    await pack_cache.stop()
+    await question_timers.close()
+    application.bot_data["warm_up_task"].cancel()
+    application.bot_data["store_flush_task"].cancel()
+    application.bot_data["expiry_sweep_task"].cancel()
+    metrics_server = application.bot_data.get("metrics_server")
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    tracing.configure(None)
+    loop_watchdog = application.bot_data.get("loop_watchdog")
+    if loop_watchdog is not None:
+        await loop_watchdog.stop()
+    watchdog.configure(None)
+    game_state_manager.store.close()
+    if grpc_client is not None:
+        await grpc_client.close()
+        grpc_client = None
+
+
+@instrumented
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle the /start command"""
+    """Handle the /start command, joining the game of a t.me/<bot>?start=<code> link"""
+    if context.args:
+        await join_game(update, context, context.args[0])
+        return
+    
     welcome_message = (
         "🎉 Welcome to the Quiz Bot! 🎉\n\n"
         "I can help you play quiz games with your friends!\n\n"
         "Available commands:\n"
         "/start - Show this help message\n"
         "/newgame - Start a new quiz game\n"
-        "/join - Join an existing game (only works when a game is waiting for players)\n"
+        "/join <code> - Join a game waiting for players by its join code\n"
         "/packs - List available quiz packs\n"
         "/cancel - Cancel current game\n\n"
         "To start playing, use /newgame and select a quiz pack!"
@@ -61,11 +293,11 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(welcome_message)
 
 
+@instrumented
 async def packs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /packs command to list available quiz packs"""
     try:
-        client = get_grpc_client()
-        packs = client.get_all_packs()
+        packs = await pack_cache.get_packs()
         
         if not packs:
             await update.message.reply_text("No quiz packs available at the moment.")
@@ -83,12 +315,12 @@ async def packs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Sorry, I couldn't fetch the quiz packs at the moment. Please try again later.")
 
 
+@instrumented
 async def newgame_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /newgame command to start a new game"""
     try:
-        client = get_grpc_client()
         # Get available packs
-        packs = client.get_all_packs()
+        packs = await pack_cache.get_packs()
         
         if not packs:
             await update.message.reply_text("No quiz packs available. Please ask an admin to add some packs.")
@@ -118,8 +350,21 @@ async def newgame_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+@instrumented
 async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle the /join command to join an existing game"""
+    """Handle the /join <code> command to join a game waiting for players"""
+    if not context.args:
+        await update.message.reply_text(
+            "Ask the game creator for the join code and send /join <code>.",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        return
+    
+    await join_game(update, context, context.args[0])
+
+
+async def join_game(update: Update, context: ContextTypes.DEFAULT_TYPE, join_code: str):
+    """Add the user to the game with a join code"""
     user = update.effective_user
     session_state = game_state_manager.get_session_by_user(user.id)
     
@@ -142,29 +387,28 @@ async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         return
     
-    # Find any active sessions waiting for players
-    waiting_sessions = [
-        session for session in game_state_manager.sessions.values()
-        if session.state == "waiting"
-    ]
+    session_to_join = game_state_manager.get_session_by_join_code(join_code)
     
-    if not waiting_sessions:
+    if not session_to_join:
         await update.message.reply_text(
-            "There are no games currently waiting for players. "
-            "Start a new game with /newgame!",
+            "There is no game with the code {}. "
+            "Check the code or start a new game with /newgame!".format(join_code),
             reply_markup=ReplyKeyboardRemove()
         )
         return
     
-    # For simplicity, join the first waiting session
-    # In a real implementation, you might want to let the user choose
-    session_to_join = waiting_sessions[0]
+    if session_to_join.state != "waiting":
+        await update.message.reply_text(
+            "That game has already started. Start a new game with /newgame!",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        return
     
     # Add player to the session
     player_name = user.first_name or user.username or "Player_{}".format(user.id)
     try:
         client = get_grpc_client()
-        player = client.add_player(session_to_join.game_session_id, player_name)
+        player = await client.add_player(session_to_join.game_session_id, player_name)
     except Exception as e:
         logger.error("Error adding player: {}".format(e))
         await update.message.reply_text(
@@ -187,7 +431,7 @@ async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Get all players in the session
     try:
-        players = client.get_players(session_to_join.game_session_id)
+        players = await client.get_players(session_to_join.game_session_id)
     except Exception as e:
         logger.error("Error getting players: {}".format(e))
         await update.message.reply_text(
@@ -204,11 +448,11 @@ async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     message += "\nWait for the game creator to start the game with the 'Start Game' button."
     
-    # For now, we'll just send to the joining player
-    # In a real implementation, you'd want to notify all players
-    await update.message.reply_text(message, reply_markup=ReplyKeyboardRemove())
+    # The creator keeps the waiting room keyboard, so don't touch reply markup
+    await broadcast_to_session(context, session_to_join, message)
 
 
+@instrumented
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /cancel command to cancel current game"""
     user = update.effective_user
@@ -222,12 +466,7 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Remove user from session
-    if user.id in session_state.players:
-        del session_state.players[user.id]
-    
-    # Remove user session reference
-    if user.id in game_state_manager.user_sessions:
-        del game_state_manager.user_sessions[user.id]
+    game_state_manager.remove_player_from_session(session_state.game_session_id, user.id)
     
     await update.message.reply_text(
         "You've left the game.",
@@ -235,6 +474,7 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+@instrumented
 async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle pack selection for a new game"""
     user = update.effective_user
@@ -274,7 +514,7 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
     # Create a new game session
     try:
         client = get_grpc_client()
-        game_session = client.create_game_session(selected_pack.id)
+        game_session = await client.create_game_session(selected_pack.id)
     except Exception as e:
         logger.error("Error creating game session: {}".format(e))
         await update.message.reply_text(
@@ -292,13 +532,13 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
     
     # Create game state
     session_state = game_state_manager.create_session(
-        game_session.id, selected_pack.id
+        game_session.id, selected_pack.id, user.id
     )
     
     # Add the creator as the first player
     player_name = user.first_name or user.username or "Player_{}".format(user.id)
     try:
-        player = client.add_player(game_session.id, player_name)
+        player = await client.add_player(game_session.id, player_name)
     except Exception as e:
         logger.error("Error adding player: {}".format(e))
         await update.message.reply_text(
@@ -323,9 +563,9 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
         game_session.id, user.id, player.id, player_name
     )
     
-    # Get questions for this pack
+    # Get questions for this pack together with the variants of every question
     try:
-        questions = client.get_questions_by_pack_id(selected_pack.id)
+        questions, variants = await pack_content_cache.get_pack_content(selected_pack.id)
     except Exception as e:
         logger.error("Error getting questions: {}".format(e))
         await update.message.reply_text(
@@ -346,8 +586,9 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
         game_state_manager.remove_session(game_session.id)
         return
     
-    # Store questions in game state
+    # Store questions and variants in game state
     game_state_manager.set_session_questions(game_session.id, questions)
+    game_state_manager.set_session_variants(game_session.id, variants)
     
     # Create waiting room keyboard
     keyboard = [["Start Game"], ["Cancel Game"]]
@@ -358,14 +599,16 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
     message += "Questions: {}\n\n".format(len(questions))
     message += "Players:\n• {} (creator)\n\n".format(player_name)
     message += "Waiting for more players to join...\n"
-    message += "Other players can join with /join\n\n"
+    message += "Join code: {}\n".format(session_state.join_code)
+    message += "Other players can join with /join {} or this link:\n".format(session_state.join_code)
+    message += "https://t.me/{}?start={}\n\n".format(context.bot.username, session_state.join_code)
     message += "When ready, press 'Start Game' to begin!"
     
     await update.message.reply_text(message, reply_markup=reply_markup)
-    context.user_data["game_creator"] = True
     context.user_data["current_game_session_id"] = game_session.id
 
 
+@instrumented
 async def handle_waiting_room_action(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle actions in the waiting room"""
     user = update.effective_user
@@ -376,8 +619,8 @@ async def handle_waiting_room_action(update: Update, context: ContextTypes.DEFAU
     if not session_state:
         return
     
-    # Check if user is the game creator
-    is_creator = context.user_data.get("game_creator", False)
+    # Check if user is the game creator, recorded with the session so it survives a restart
+    is_creator = session_state.creator_telegram_user_id == user.id
     
     if message_text == "Start Game":
         if not is_creator:
@@ -387,7 +630,7 @@ async def handle_waiting_room_action(update: Update, context: ContextTypes.DEFAU
         # Start the game
         try:
             client = get_grpc_client()
-            game_session = client.start_game_session(session_state.game_session_id)
+            game_session = await client.start_game_session(session_state.game_session_id)
         except Exception as e:
             logger.error("Error starting game session: {}".format(e))
             await update.message.reply_text(
@@ -410,29 +653,63 @@ async def handle_waiting_room_action(update: Update, context: ContextTypes.DEFAU
         message = "🚀 Game Starting!\n\n"
         message += "Get ready for the first question!"
         
-        await update.message.reply_text(
-            message,
+        await broadcast_to_session(
+            context, session_state, message,
             reply_markup=ReplyKeyboardRemove()
         )
         
         # Present the first question
-        await present_question(update, context, session_state.game_session_id)
+        await present_question(context, session_state.game_session_id)
         
     elif message_text == "Cancel Game":
         if not is_creator:
             await update.message.reply_text("Only the game creator can cancel the game!")
             return
         
-        # Clean up the game session
+        # Notify all players, then clean up the game session
+        await broadcast_to_session(
+            context, session_state, "Game cancelled.",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        
         game_state_manager.remove_session(session_state.game_session_id)
+
+
+def schedule_question_timeout(application: Application, session_state: GameSessionState):
+    """Move the game on once the time limit of its current question runs out"""
+    time_limit = get_question_time_limit(session_state.pack_id)
+    question = game_state_manager.get_current_question(session_state.game_session_id)
+    if time_limit and question:
+        question_timers.schedule(
+            session_state.game_session_id, time_limit,
+            question_timed_out, application, session_state.game_session_id, question.id
+        )
+
+
+@instrumented
+async def question_timed_out(application: Application, game_session_id: str, question_id: str):
+    """Show the next question when nobody answered the current one in time"""
+    context = CallbackContext(application)
+    async with game_state_manager.session_lock(game_session_id):
+        session_state = game_state_manager.get_session(game_session_id)
+        current_question = game_state_manager.get_current_question(game_session_id)
+        # The question may have been answered while the timer was due
+        if (not session_state or session_state.state != "active" or not current_question
+                or current_question.id != question_id):
+            return
         
-        await update.message.reply_text(
-            "Game cancelled.",
+        await broadcast_to_session(
+            context, session_state, "⌛ Time's up! Nobody answered in time.",
             reply_markup=ReplyKeyboardRemove()
         )
+        
+        if game_state_manager.advance_question(game_session_id):
+            await present_question(context, game_session_id)
+        else:
+            await end_game(context, game_session_id)
 
 
-async def present_question(update: Update, context: ContextTypes.DEFAULT_TYPE, game_session_id: str):
+async def present_question(context: ContextTypes.DEFAULT_TYPE, game_session_id: str):
     """Present the current question to all players"""
     session_state = game_state_manager.get_session(game_session_id)
     
@@ -444,33 +721,33 @@ async def present_question(update: Update, context: ContextTypes.DEFAULT_TYPE, g
     
     if not question:
         # No more questions, end the game
-        await end_game(update, context, game_session_id)
+        await end_game(context, game_session_id)
         return
     
-    # Get variants for this question
-    try:
-        client = get_grpc_client()
-        variants = client.get_variants_by_question_id(question.id)
-    except Exception as e:
-        logger.error("Error getting variants: {}".format(e))
-        await update.message.reply_text(
-            "Sorry, there was an error retrieving the question. Please try again.",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return
+    # Variants were prefetched when the game was created
+    variants = game_state_manager.get_current_variants(game_session_id)
     
     if not variants:
         # Skip this question if no variants
         if game_state_manager.advance_question(game_session_id):
-            await present_question(update, context, game_session_id)
+            await present_question(context, game_session_id)
         else:
-            await end_game(update, context, game_session_id)
+            await end_game(context, game_session_id)
         return
     
-    # Create keyboard with answer options
-    keyboard = [[variant.text] for variant in variants]
-    keyboard.append(["Leave Game"])
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    # Buttons carry the indexes of the question and variant, so an answer is
+    # decoded without matching texts; the keyboard is shared by all players
+    question_index = session_state.current_question_index
+    keyboard = [
+        [InlineKeyboardButton(variant.text, callback_data="{}:{}:{}:{}".format(
+            ANSWER_ACTION, session_state.join_code, question_index, variant_index
+        ))]
+        for variant_index, variant in enumerate(variants)
+    ]
+    keyboard.append([InlineKeyboardButton(
+        "Leave Game", callback_data="{}:{}".format(LEAVE_ACTION, session_state.join_code)
+    )])
+    reply_markup = InlineKeyboardMarkup(keyboard)
     
     # Format question message
     message = "❓ Question {}/{}:\n\n".format(session_state.current_question_index + 1, len(session_state.questions))
@@ -479,118 +756,162 @@ async def present_question(update: Update, context: ContextTypes.DEFAULT_TYPE, g
     if question.image_url:
         message += "Image: {}\n\n".format(question.image_url)
     
+    time_limit = get_question_time_limit(session_state.pack_id)
+    if time_limit:
+        message += "You have {:g} seconds. ".format(time_limit)
     message += "Choose your answer:"
     
-    # For now, we'll just send to the user who triggered the question
-    # In a real implementation, you'd want to send to all players
-    await update.message.reply_text(message, reply_markup=reply_markup)
+    # The clock starts before sending, so every player gets the same deadline
+    schedule_question_timeout(context.application, session_state)
     
-    # Store question context for answer processing
-    context.user_data["awaiting_answer"] = True
-    context.user_data["current_question_id"] = question.id
-    context.user_data["current_variants"] = variants
+    # Send the question to all players
+    await broadcast_to_session(context, session_state, message, reply_markup=reply_markup)
 
 
+@instrumented
 async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle player answers"""
+    """Handle a press of an answer or Leave Game button under a question"""
+    query = update.callback_query
     user = update.effective_user
-    message_text = update.message.text
     
-    # Check if we're waiting for an answer
-    if not context.user_data.get("awaiting_answer"):
-        return
-    
-    # Check if player wants to leave
-    if message_text == "Leave Game":
-        await cancel_command(update, context)
-        return
+    # Decode the button, see present_question
+    action, join_code, *indexes = query.data.split(":")
+    session_state = game_state_manager.get_session_by_join_code(join_code)
+    player_state = session_state.players.get(user.id) if session_state else None
     
-    # Get current question and variants
-    question_id = context.user_data.get("current_question_id")
-    variants = context.user_data.get("current_variants", [])
-    
-    if not question_id or not variants:
+    if not player_state:
+        await close_question(query, "You're not in this game anymore.")
         return
     
-    # Find the selected variant
-    selected_variant = None
-    for variant in variants:
-        if variant.text == message_text:
-            selected_variant = variant
-            break
-    
-    if not selected_variant:
-        await update.message.reply_text("Invalid answer. Please select one of the options.")
+    if action == LEAVE_ACTION:
+        game_state_manager.remove_player_from_session(session_state.game_session_id, user.id)
+        await close_question(query, "You've left the game.")
         return
     
-    # Clear the flag
-    context.user_data["awaiting_answer"] = False
-    
-    # Get session state
-    session_state = game_state_manager.get_session_by_user(user.id)
+    question_index, variant_index = map(int, indexes)
     
-    if not session_state:
-        await update.message.reply_text(
-            "You're not in a game. Start a new game with /newgame",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return
-    
-    # Get player state
-    player_state = game_state_manager.get_player_state(session_state.game_session_id, user.id)
-    
-    if not player_state:
-        await update.message.reply_text(
-            "You're not registered in this game.",
-            reply_markup=ReplyKeyboardRemove()
+    # Answers to one session are applied one at a time, in arrival order
+    async with game_state_manager.session_lock(session_state.game_session_id):
+        # Another answer may have moved the game on while we were waiting
+        current_question = game_state_manager.get_current_question(session_state.game_session_id)
+        if (session_state.state != "active" or not current_question
+                or session_state.current_question_index != question_index):
+            await close_question(query, "⌛ Too late, this question has already been answered.")
+            return
+        
+        variants = game_state_manager.get_current_variants(session_state.game_session_id)
+        if variant_index >= len(variants):
+            await query.answer("Invalid answer. Please select one of the options.")
+            return
+        
+        question_id = current_question.id
+        selected_variant = variants[variant_index]
+        local_correctness = get_local_correctness(selected_variant) if OPTIMISTIC_SCORING else None
+        
+        if local_correctness is not None:
+            # Score locally and let the backend confirm it in the background
+            is_correct = local_correctness
+            points = POINTS_PER_CORRECT_ANSWER if is_correct else 0
+            task = context.application.create_task(reconcile_answer(
+                session_state.game_session_id, user.id, player_state.player_id,
+                question_id, selected_variant.id, is_correct, points
+            ))
+            track_reconciliation(session_state.game_session_id, task)
+        else:
+            # Submit answer to backend
+            try:
+                response = await answer_batcher.submit_answer(
+                    player_state.player_id, question_id, selected_variant.id
+                )
+            except Exception as e:
+                logger.error("Error submitting answer: {}".format(e))
+                response = None
+            
+            if not response:
+                # The buttons stay, so the player can try again
+                await query.answer("Sorry, there was an error submitting your answer. Please try again.")
+                return
+            
+            is_correct = response.is_correct
+            points = response.points
+        
+        # Record answer in game state
+        game_state_manager.record_answer(
+            session_state.game_session_id, user.id, question_id, 
+            selected_variant.id, is_correct, points
         )
-        return
+        
+        # Send feedback in the question message instead of a new one
+        if is_correct:
+            feedback = "✅ Correct! You earned {} points.".format(points)
+        else:
+            feedback = "❌ Incorrect. Better luck next time!"
+        
+        await close_question(query, "Your answer: {}\n{}".format(selected_variant.text, feedback), feedback)
+        
+        # Advance to next question or end game
+        if game_state_manager.advance_question(session_state.game_session_id):
+            # Present next question
+            await present_question(context, session_state.game_session_id)
+        else:
+            # End the game
+            await end_game(context, session_state.game_session_id)
+
+
+async def close_question(query: CallbackQuery, outcome: str, toast: Optional[str] = None):
+    """Acknowledge a button press and replace the buttons under the question with its outcome
     
-    # Submit answer to backend
+    Errors are only logged: by now the answer is recorded and the game has
+    to move on whether or not the player saw the outcome.
+    """
     try:
-        client = get_grpc_client()
-        response = client.submit_answer(
-            player_state.player_id, question_id, selected_variant.id
-        )
+        await query.answer(toast)
+    except TelegramError as e:
+        logger.warning("Could not answer callback query of user {}: {}".format(query.from_user.id, e))
+    try:
+        await query.edit_message_text("{}\n\n{}".format(query.message.text, outcome))
+    except TelegramError as e:
+        logger.warning("Could not edit question message of user {}: {}".format(query.from_user.id, e))
+
+
+def get_local_correctness(variant) -> Optional[bool]:
+    """Get whether a variant is correct from the variant itself, if it says so"""
+    descriptor = getattr(variant, "DESCRIPTOR", None)
+    if descriptor is None or "is_correct" not in descriptor.fields_by_name:
+        return None
+    return bool(variant.is_correct)
+
+
+async def reconcile_answer(game_session_id: str, telegram_user_id: int, player_id: str,
+                           question_id: str, variant_id: str, is_correct: bool, points: int):
+    """Submit an optimistically scored answer and correct the score if the backend disagrees"""
+    try:
+        response = await answer_batcher.submit_answer(player_id, question_id, variant_id)
     except Exception as e:
-        logger.error("Error submitting answer: {}".format(e))
-        await update.message.reply_text(
-            "Sorry, there was an error submitting your answer. Please try again.",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return
+        logger.error("Error submitting optimistically scored answer: {}".format(e))
+        response = None
     
     if not response:
-        await update.message.reply_text(
-            "Sorry, there was an error submitting your answer. Please try again.",
-            reply_markup=ReplyKeyboardRemove()
-        )
+        # SubmitAnswer isn't idempotent, so rather than risk recording the
+        # answer twice, take back the points the backend never confirmed
+        logger.error("Backend did not accept the answer of player {} to question {}, "
+                     "revoking its local score".format(player_id, question_id))
+        game_state_manager.correct_answer(game_session_id, telegram_user_id, question_id, False, 0)
         return
     
-    # Record answer in game state
-    game_state_manager.record_answer(
-        session_state.game_session_id, user.id, question_id, 
-        selected_variant.id, response.is_correct, response.points
-    )
-    
-    # Send feedback
-    if response.is_correct:
-        feedback = "✅ Correct! You earned {} points.".format(response.points)
-    else:
-        feedback = "❌ Incorrect. Better luck next time!"
-    
-    await update.message.reply_text(feedback, reply_markup=ReplyKeyboardRemove())
-    
-    # Advance to next question or end game
-    if game_state_manager.advance_question(session_state.game_session_id):
-        # Present next question
-        await present_question(update, context, session_state.game_session_id)
-    else:
-        # End the game
-        await end_game(update, context, session_state.game_session_id)
+    if response.is_correct != is_correct or (is_correct and response.points != points):
+        logger.warning(
+            "Optimistic score mismatch for player {} on question {}: "
+            "local ({}, {}), backend ({}, {})".format(
+                player_id, question_id, is_correct, points, response.is_correct, response.points
+            )
+        )
+        game_state_manager.correct_answer(
+            game_session_id, telegram_user_id, question_id, response.is_correct, response.points
+        )
 
 
-async def end_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game_session_id: str):
+async def end_game(context: ContextTypes.DEFAULT_TYPE, game_session_id: str):
     """End the game and show results"""
     session_state = game_state_manager.get_session(game_session_id)
     
@@ -600,14 +921,21 @@ async def end_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game_sess
     # End game session in backend
     try:
         client = get_grpc_client()
-        client.end_game_session(game_session_id)
+        await client.end_game_session(game_session_id)
     except Exception as e:
         logger.error("Error ending game session: {}".format(e))
         # Continue anyway, as we want to show results
     
+    # Let the backend confirm optimistically scored answers before showing scores
+    reconciliations = pending_reconciliations.pop(game_session_id, set())
+    if reconciliations:
+        await asyncio.gather(*reconciliations, return_exceptions=True)
+    
     # Update game state
     game_state_manager.end_session(game_session_id)
     
+    question_timers.cancel(game_session_id)
+    
     # Get results
     results = game_state_manager.get_session_results(game_session_id)
     
@@ -629,13 +957,13 @@ async def end_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game_sess
     message += "\nThanks for playing! Start a new game with /newgame"
     
     # Send results to all players
-    # For now, we'll just send to the user who triggered the end
-    await update.message.reply_text(message, reply_markup=ReplyKeyboardRemove())
+    await broadcast_to_session(context, session_state, message, reply_markup=ReplyKeyboardRemove())
     
     # Clean up session
     game_state_manager.remove_session(game_session_id)
 
 
+@instrumented
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle regular text messages"""
     user = update.effective_user
@@ -653,11 +981,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await handle_waiting_room_action(update, context)
             return
     
-    # Check if we're waiting for an answer
-    if context.user_data.get("awaiting_answer"):
-        await handle_answer(update, context)
-        return
-    
     # Default response
     await update.message.reply_text(
         "I didn't understand that command. Use /start to see available commands.",
@@ -665,10 +988,35 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-def main():
-    """Start the bot"""
-    # Create the Application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+def create_session_store(sqlite_path: str = STORAGE_SQLITE_PATH) -> SessionStore:
+    """Create the session store selected in the config"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteSessionStore(sqlite_path, STORAGE_BATCH_SIZE, STORAGE_FLUSH_INTERVAL)
+    return MemorySessionStore()
+
+
+def application_builder():
+    """Get an Application builder for the configured bot and Bot API endpoint"""
+    return (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(TELEGRAM_API_BASE_URL)
+    )
+
+
+def build_application(with_updater: bool = True) -> Application:
+    """Create the Application and register all handlers"""
+    builder = (
+        application_builder()
+        # Handlers await the backend, so let updates from different chats overlap
+        .concurrent_updates(True)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if not with_updater:
+        # Updates are fed in by the caller, e.g. a shard worker
+        builder = builder.updater(None)
+    application = builder.build()
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -677,13 +1025,67 @@ def main():
     application.add_handler(CommandHandler("join", join_command))
     application.add_handler(CommandHandler("cancel", cancel_command))
     
+    # Add handler for the answer buttons under questions
+    application.add_handler(CallbackQueryHandler(
+        handle_answer, pattern=r"^({}:\w+:\d+:\d+|{}:\w+)$".format(ANSWER_ACTION, LEAVE_ACTION)
+    ))
+    
     # Add message handler for text messages
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
+    return application
+
+
+def run_application(application: Application):
+    """Receive updates with polling or the built-in webhook server, as configured"""
+    if TELEGRAM_MODE == "webhook":
+        webhook_url = WEBHOOK_URL
+        if not webhook_url:
+            # Telegram only delivers to public HTTPS URLs, the listen address
+            # is only good enough for a fake Bot API such as benchmarks/fake_telegram.py
+            if TELEGRAM_API_BASE_URL == DEFAULT_TELEGRAM_API_BASE_URL:
+                raise ValueError(
+                    "telegram.webhook.url must be set to the public HTTPS URL of the webhook in webhook mode"
+                )
+            webhook_url = "http://{}:{}/{}".format(WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        logger.info("Receiving updates via webhook at {}".format(webhook_url))
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=webhook_url,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        logger.info("Receiving updates via long polling")
+        application.run_polling()
+
+
+def main(started_at: Optional[float] = None):
+    """Start the bot
+
+    started_at is the time.perf_counter() reading taken when the process
+    started, used to log how long startup took.
+    """
+    logging.basicConfig(level=logging.INFO)
+    
+    if SHARD_WORKERS > 1:
+        # Import lazily, single-process deployments never need it
+        from game_bot.sharding import run_sharded
+        run_sharded(SHARD_WORKERS)
+        return
+    
+    # Restore running games from persistent storage
+    game_state_manager.use_store(create_session_store())
+    
+    application = build_application()
+    application.bot_data["started_at"] = started_at if started_at is not None else time.perf_counter()
+    
     # Run the bot
     logger.info("Starting Telegram bot...")
-    application.run_polling()
+    run_application(application)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,138 @@
+"""
+Rate-limited fan-out of messages to every player of a game session
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from telegram import Bot, Message
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows rate operations per second with bursts of up to capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def is_full(self) -> bool:
+        """Check whether the bucket has refilled completely"""
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class BroadcastResult:
+    """Outcome of sending one message to a set of chats"""
+    delivered: int
+    failed: int
+    latency: float  # seconds until the last chat got the message or gave up
+
+
+class Broadcaster:
+    """Sends messages to many chats concurrently within Telegram's rate limits
+
+    Every send takes a token from a global bucket and from the bucket of
+    its chat. 429 responses are retried after the delay Telegram asks for,
+    network errors with exponential backoff and jitter.
+
+    The global bucket only limits this process. Processes sharing a bot
+    token must split Telegram's limit between them, see set_global_rate.
+    """
+
+    def __init__(self, global_rate: float, per_chat_rate: float, per_chat_burst: float,
+                 max_retries: int, retry_backoff: float = 0.5, max_tracked_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_tracked_chats = max_tracked_chats
+        self._chat_buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+
+    def set_global_rate(self, rate: float):
+        """Change the rate of the global bucket, e.g. to this process's share of the bot's limit"""
+        self.global_bucket = TokenBucket(rate, max(rate, 1))
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+            # Forget the least recently used chats once they have refilled
+            while len(self._chat_buckets) > self.max_tracked_chats:
+                oldest_chat_id, oldest = next(iter(self._chat_buckets.items()))
+                if not oldest.is_full():
+                    break
+                del self._chat_buckets[oldest_chat_id]
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def send_message(self, bot: Bot, chat_id: int, text: str, **kwargs) -> Optional[Message]:
+        """Send a message to one chat, returning None if it could not be delivered"""
+        for attempt in range(self.max_retries + 1):
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                return await bot.send_message(chat_id, text, **kwargs)
+            except RetryAfter as e:
+                delay = float(e.retry_after)
+                logger.warning("Rate limited sending to chat {}, retrying in {}s".format(chat_id, delay))
+            except Forbidden as e:
+                # The user blocked the bot or never started a chat with it
+                logger.warning("Cannot send to chat {}: {}".format(chat_id, e))
+                return None
+            except BadRequest as e:
+                # A subclass of NetworkError, but retrying won't fix a bad chat or message
+                logger.error("Bad request sending to chat {}: {}".format(chat_id, e))
+                return None
+            except NetworkError as e:
+                delay = self.retry_backoff * 2 ** attempt * (1 + random.random())
+                logger.warning("Network error sending to chat {}: {}".format(chat_id, e))
+            except TelegramError as e:
+                logger.error("Failed to send to chat {}: {}".format(chat_id, e))
+                return None
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+        logger.error("Giving up sending to chat {} after {} attempts".format(chat_id, self.max_retries + 1))
+        return None
+
+    async def broadcast(self, bot: Bot, chat_ids: Iterable[int], text: str, **kwargs) -> BroadcastResult:
+        """Send the same message to all chats concurrently"""
+        start = time.monotonic()
+        chat_ids = list(chat_ids)
+        messages = await asyncio.gather(
+            *(self.send_message(bot, chat_id, text, **kwargs) for chat_id in chat_ids)
+        )
+        delivered = sum(1 for message in messages if message is not None)
+        result = BroadcastResult(delivered, len(chat_ids) - delivered, time.monotonic() - start)
+        logger.info("Broadcast to {} chats in {:.3f}s ({} failed)".format(
+            len(chat_ids), result.latency, result.failed
+        ))
+        return result
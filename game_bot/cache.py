@@ -0,0 +1,147 @@
+"""
+In-memory caches in front of the backend service
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class PackCatalogueCache:
+    """Caches the pack catalogue returned by GetAllPacks
+
+    Fresh data is served straight from memory. Once the TTL has passed the
+    stale catalogue is still served while a single refresh runs in the
+    background, so bursts of /packs and /newgame never wait on the backend
+    unless nothing has been fetched yet.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[List[object]]],
+                 ttl: float, refresh_interval: float):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._packs: Optional[List[object]] = None
+        self._fetched_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._background_task: Optional[asyncio.Task] = None
+
+    def is_stale(self) -> bool:
+        """Check whether the cached catalogue is missing or older than the TTL"""
+        return self._packs is None or time.monotonic() - self._fetched_at >= self.ttl
+
+    async def get_packs(self) -> List[object]:
+        """Get the pack catalogue, revalidating it in the background when stale"""
+        if self._packs is None:
+            return await self.refresh()
+        if self.is_stale():
+            self._start_refresh()
+        return self._packs
+
+    async def refresh(self) -> List[object]:
+        """Fetch the catalogue from the backend, sharing any refresh in flight"""
+        return await asyncio.shield(self._start_refresh())
+
+    def invalidate(self):
+        """Mark the cached catalogue as stale"""
+        self._fetched_at = 0.0
+
+    def start(self):
+        """Start the periodic background refresh"""
+        if self._background_task is None:
+            self._background_task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        """Stop the periodic background refresh"""
+        if self._background_task is not None:
+            self._background_task.cancel()
+            try:
+                await self._background_task
+            except asyncio.CancelledError:
+                pass
+            self._background_task = None
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._do_refresh())
+        return self._refresh_task
+
+    async def _do_refresh(self) -> List[object]:
+        packs = await self._fetch()
+        if packs:
+            self._packs = packs
+            self._fetched_at = time.monotonic()
+        elif self._packs is not None:
+            # The client reports errors as an empty list, keep serving what we have
+            logger.warning("Pack catalogue refresh returned no packs, keeping cached catalogue")
+        return self._packs if self._packs is not None else packs
+
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Error refreshing pack catalogue: {}".format(e))
+
+
+class PackContentCache:
+    """LRU cache of a pack's questions and the variants of every question
+
+    Keyed by pack_id and shared by all games in the process, so a popular
+    pack is fetched from the backend once rather than once per game.
+    Concurrent requests for a pack that is not cached yet share one fetch.
+    """
+
+    def __init__(self, fetch_questions: Callable[[str], Awaitable[List[object]]],
+                 fetch_variants: Callable[[str], Awaitable[List[object]]],
+                 max_packs: int):
+        self._fetch_questions = fetch_questions
+        self._fetch_variants = fetch_variants
+        self.max_packs = max_packs
+        self._packs: "OrderedDict[str, Tuple[List[object], Dict[str, List[object]]]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def get_pack_content(self, pack_id: str) -> Tuple[List[object], Dict[str, List[object]]]:
+        """Get the questions of a pack and the variants keyed by question ID"""
+        content = self._packs.get(pack_id)
+        if content is not None:
+            self._packs.move_to_end(pack_id)
+            return content
+        
+        task = self._pending.get(pack_id)
+        if task is None:
+            task = asyncio.create_task(self._load(pack_id))
+            self._pending[pack_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(pack_id, None))
+        return await asyncio.shield(task)
+
+    def invalidate(self, pack_id: str):
+        """Drop a pack from the cache"""
+        self._packs.pop(pack_id, None)
+
+    async def _load(self, pack_id: str) -> Tuple[List[object], Dict[str, List[object]]]:
+        questions = await self._fetch_questions(pack_id)
+        variant_lists = await asyncio.gather(
+            *(self._fetch_variants(question.id) for question in questions)
+        )
+        variants = {
+            question.id: question_variants
+            for question, question_variants in zip(questions, variant_lists)
+        }
+        content = (questions, variants)
+        
+        # The client reports errors as empty lists, so only cache complete packs
+        if questions and all(variant_lists):
+            self._packs[pack_id] = content
+            self._packs.move_to_end(pack_id)
+            while len(self._packs) > self.max_packs:
+                self._packs.popitem(last=False)
+        else:
+            logger.warning("Pack {} was fetched incompletely, not caching it".format(pack_id))
+        return content
@@ -13,13 +13,89 @@ load_dotenv(dotenv_path)
 # Load configuration from YAML file
 config_path = os.path.join(os.path.dirname(__file__), '..', 'config.yaml')
 with open(config_path, 'r') as f:
-    config = yaml.safe_load(f)
+    # The libyaml based loader parses several times faster when available
+    config = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
 
 # Telegram Bot Token (from environment variable only)
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 
 # Backend service gRPC address (from environment variable or config file)
 BACKEND_GRPC_ADDRESS = os.getenv("BACKEND_GRPC_ADDRESS") or config.get('backend', {}).get('grpc_address', "localhost:8081")
+BACKEND_GRPC_ADDRESSES = (
+    [address.strip() for address in os.getenv("BACKEND_GRPC_ADDRESSES", "").split(",") if address.strip()]
+    or config.get('backend', {}).get('grpc_addresses')
+    or [BACKEND_GRPC_ADDRESS]
+)
+CHANNEL_POOL_SIZE = config.get('backend', {}).get('channel_pool', {}).get('size', 4)
+CHANNEL_KEEPALIVE_TIME_MS = config.get('backend', {}).get('channel_pool', {}).get('keepalive_time_ms', 30000)
+CHANNEL_KEEPALIVE_TIMEOUT_MS = config.get('backend', {}).get('channel_pool', {}).get('keepalive_timeout_ms', 10000)
+CHANNEL_HEALTH_CHECK = config.get('backend', {}).get('channel_pool', {}).get('health_check', True)
+SUBMIT_BATCH_WINDOW_MS = config.get('backend', {}).get('submit_batch_window_ms', 0)
+SUBMIT_BATCH_MAX_SIZE = config.get('backend', {}).get('submit_batch_max_size', 100)
+BACKEND_DEADLINES = config.get('backend', {}).get('deadlines', {})
+RETRY_MAX_ATTEMPTS = config.get('backend', {}).get('retry', {}).get('max_attempts', 3)
+RETRY_INITIAL_BACKOFF = config.get('backend', {}).get('retry', {}).get('initial_backoff', 0.1)
+RETRY_MAX_BACKOFF = config.get('backend', {}).get('retry', {}).get('max_backoff', 2.0)
+CIRCUIT_FAILURE_THRESHOLD = config.get('backend', {}).get('circuit_breaker', {}).get('failure_threshold', 5)
+CIRCUIT_RESET_TIMEOUT = config.get('backend', {}).get('circuit_breaker', {}).get('reset_timeout', 30)
+STALE_CACHE_SIZE = config.get('backend', {}).get('stale_cache_size', 10000)
 
 # Game settings (from config file)
-POINTS_PER_CORRECT_ANSWER = config.get('game', {}).get('points_per_correct_answer', 10)
\ No newline at end of file
+POINTS_PER_CORRECT_ANSWER = config.get('game', {}).get('points_per_correct_answer', 10)
+OPTIMISTIC_SCORING = config.get('game', {}).get('optimistic_scoring', False)
+QUESTION_TIME_LIMIT = config.get('game', {}).get('question_time_limit', 30)
+PACK_QUESTION_TIME_LIMITS = config.get('game', {}).get('pack_question_time_limits') or {}
+
+# Cache settings (from config file)
+PACK_CATALOGUE_TTL = config.get('cache', {}).get('pack_catalogue_ttl', 60)
+PACK_CATALOGUE_REFRESH_INTERVAL = config.get('cache', {}).get('pack_catalogue_refresh_interval', 30)
+PACK_CONTENT_MAX_PACKS = config.get('cache', {}).get('pack_content_max_packs', 128)
+
+# Game state storage settings (from config file)
+STORAGE_BACKEND = config.get('storage', {}).get('backend', "memory")
+STORAGE_SQLITE_PATH = config.get('storage', {}).get('sqlite_path', "game_state.db")
+STORAGE_BATCH_SIZE = config.get('storage', {}).get('batch_size', 200)
+STORAGE_FLUSH_INTERVAL = config.get('storage', {}).get('flush_interval', 1.0)
+
+# Game session expiry settings (from config file)
+SESSION_IDLE_TTLS = config.get('sessions', {}).get('idle_ttl', {"waiting": 1800, "active": 3600, "finished": 300})
+SESSION_SWEEP_INTERVAL = config.get('sessions', {}).get('sweep_interval', 30)
+
+# Sharding settings (from config file)
+SHARD_WORKERS = config.get('sharding', {}).get('workers', 0)
+SHARD_VIRTUAL_NODES = config.get('sharding', {}).get('virtual_nodes', 100)
+
+# Telegram update ingestion settings (from config file)
+TELEGRAM_MODE = config.get('telegram', {}).get('mode', "polling")
+DEFAULT_TELEGRAM_API_BASE_URL = "https://api.telegram.org/bot"
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL") or config.get('telegram', {}).get('api_base_url', DEFAULT_TELEGRAM_API_BASE_URL)
+WEBHOOK_LISTEN = config.get('telegram', {}).get('webhook', {}).get('listen', "0.0.0.0")
+WEBHOOK_PORT = config.get('telegram', {}).get('webhook', {}).get('port', 8443)
+WEBHOOK_PATH = config.get('telegram', {}).get('webhook', {}).get('path', "telegram")
+WEBHOOK_URL = config.get('telegram', {}).get('webhook', {}).get('url') or None
+WEBHOOK_SECRET_TOKEN = os.getenv("TELEGRAM_WEBHOOK_SECRET") or config.get('telegram', {}).get('webhook', {}).get('secret_token') or None
+WEBHOOK_MAX_CONNECTIONS = config.get('telegram', {}).get('webhook', {}).get('max_connections', 100)
+
+# Broadcast settings (from config file)
+BROADCAST_GLOBAL_RATE = config.get('broadcast', {}).get('global_rate', 30)
+BROADCAST_PER_CHAT_RATE = config.get('broadcast', {}).get('per_chat_rate', 1)
+BROADCAST_PER_CHAT_BURST = config.get('broadcast', {}).get('per_chat_burst', 3)
+BROADCAST_MAX_RETRIES = config.get('broadcast', {}).get('max_retries', 3)
+# Metrics endpoint settings (from config file)
+METRICS_ENABLED = config.get('metrics', {}).get('enabled', True)
+METRICS_HOST = config.get('metrics', {}).get('host', "127.0.0.1")
+METRICS_PORT = config.get('metrics', {}).get('port', 9100)
+
+# Tracing settings (from config file)
+TRACING_ENABLED = config.get('tracing', {}).get('enabled', False)
+TRACING_PATH = config.get('tracing', {}).get('path', "traces.jsonl")
+TRACING_SAMPLE_RATE = config.get('tracing', {}).get('sample_rate', 1.0)
+
+# Watchdog settings (from config file)
+WATCHDOG_ENABLED = config.get('watchdog', {}).get('enabled', True)
+WATCHDOG_INTERVAL = config.get('watchdog', {}).get('interval', 0.1)
+WATCHDOG_BLOCKED_THRESHOLD = config.get('watchdog', {}).get('blocked_threshold', 0.25)
+SLOW_HANDLER_THRESHOLD = config.get('watchdog', {}).get('slow_handler_threshold', 1.0)
+PROFILE_HANDLER = config.get('watchdog', {}).get('profile_handler') or None
+PROFILE_PATH = config.get('watchdog', {}).get('profile_path', "handler.prof")
+PROFILE_DUMP_EVERY = config.get('watchdog', {}).get('profile_dump_every', 100)
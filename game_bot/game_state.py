@@ -2,26 +2,76 @@
 Game state management for the Telegram bot
 """
 
+import asyncio
+import heapq
 import logging
-from typing import Dict, List, Optional, Any
+import secrets
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Any, Set, Tuple
 from dataclasses import dataclass, field
-from datetime import datetime
-
-# Try to import the generated proto classes
-try:
-    from proto.models import models_pb2
-except ImportError:
-    # If proto files haven't been generated yet, create a mock class
-    class MockModelsPb2:
-        class Question:
-            pass
-    models_pb2 = MockModelsPb2()
+from datetime import datetime, timedelta
+
+from game_bot.storage import SessionStore, MemorySessionStore
+
+if TYPE_CHECKING:
+    # Only for annotations, the proto modules are loaded on first backend call
+    from game_bot.proto.models import models_pb2
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Join codes avoid characters that are easy to mix up (0/O, 1/I)
+JOIN_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+JOIN_CODE_LENGTH = 6
+# Maps a random byte to a join code character, 256 is a multiple of the alphabet size
+_JOIN_CODE_TABLE = (JOIN_CODE_ALPHABET * (256 // len(JOIN_CODE_ALPHABET))).encode()
+# Join codes drawn from one call for system randomness
+_JOIN_CODE_BATCH = 1024
+
+# Wall clock reading matching the monotonic clock, used to convert answer timestamps
+_WALL_CLOCK_ANCHOR = datetime.now()
+_MONOTONIC_ANCHOR_NS = time.monotonic_ns()
+
+
+@dataclass
+class AnswerRecord:
+    """A single answer given by a player, stored compactly"""
+    __slots__ = ("question_id", "variant_id", "is_correct", "points", "timestamp_ns")
+    question_id: str
+    variant_id: str
+    is_correct: bool
+    points: int
+    timestamp_ns: int  # time.monotonic_ns() when the answer was recorded
+    
+    @property
+    def timestamp(self) -> datetime:
+        """Wall clock time the answer was recorded at"""
+        return _WALL_CLOCK_ANCHOR + timedelta(
+            microseconds=(self.timestamp_ns - _MONOTONIC_ANCHOR_NS) // 1000
+        )
+    
+    @classmethod
+    def from_datetime(cls, question_id: str, variant_id: str, is_correct: bool,
+                      points: int, timestamp: datetime) -> "AnswerRecord":
+        """Create a record for an answer given at a wall clock time"""
+        offset_us = (timestamp - _WALL_CLOCK_ANCHOR) // timedelta(microseconds=1)
+        timestamp_ns = _MONOTONIC_ANCHOR_NS + offset_us * 1000
+        return cls(sys.intern(question_id), sys.intern(variant_id), is_correct, points, timestamp_ns)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the answer to the dict shape used in session results"""
+        return {
+            "question_id": self.question_id,
+            "variant_id": self.variant_id,
+            "is_correct": self.is_correct,
+            "points": self.points,
+            "timestamp": self.timestamp
+        }
+
+
 @dataclass
 class PlayerState:
     """Represents a player's state in a game session"""
@@ -29,7 +79,7 @@ class PlayerState:
     player_name: str
     score: int = 0
     current_question_index: int = 0
-    answers: List[Dict[str, Any]] = field(default_factory=list)
+    answers: List[AnswerRecord] = field(default_factory=list)
 
 
 @dataclass
@@ -38,29 +88,201 @@ class GameSessionState:
     game_session_id: str
     pack_id: str
     state: str  # waiting, active, finished
+    join_code: Optional[str] = None  # code other players join the game with
+    creator_telegram_user_id: Optional[int] = None  # the only player who can start or cancel the game
     players: Dict[int, PlayerState] = field(default_factory=dict)  # telegram_user_id -> PlayerState
-    questions: List[models_pb2.Question] = field(default_factory=list)
+    questions: List["models_pb2.Question"] = field(default_factory=list)
+    variants: Dict[str, List["models_pb2.Variant"]] = field(default_factory=dict)  # question_id -> variants
     current_question_index: int = 0
     created_at: datetime = field(default_factory=datetime.now)
     started_at: Optional[datetime] = None
     finished_at: Optional[datetime] = None
+    last_activity: float = field(default_factory=time.monotonic)  # time.monotonic() of the last change
+    expiry_check_at: Optional[float] = None  # when the expiry heap next looks at the session
+
+
+class KeyedLocks:
+    """asyncio locks created per key on demand and dropped once unused"""
+    
+    def __init__(self):
+        self._locks: Dict[str, List[Any]] = {}  # key -> [lock, holders and waiters]
+    
+    def __len__(self) -> int:
+        return len(self._locks)
+    
+    @asynccontextmanager
+    async def acquire(self, key: str) -> AsyncIterator[None]:
+        """Hold the lock for a key; waiters are served in arrival order"""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = [asyncio.Lock(), 0]
+            self._locks[key] = entry
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
 
 
 class GameStateManager:
     """Manages game states for multiple sessions"""
     
-    def __init__(self):
+    def __init__(self, store: Optional[SessionStore] = None, idle_ttls: Optional[Dict[str, float]] = None):
+        self.store = store if store is not None else MemorySessionStore()
         self.sessions: Dict[str, GameSessionState] = {}  # game_session_id -> GameSessionState
         self.user_sessions: Dict[int, str] = {}  # telegram_user_id -> game_session_id
+        self.session_users: Dict[str, Set[int]] = {}  # game_session_id -> telegram_user_ids
+        # state -> game_session_id -> GameSessionState, in creation order
+        self.sessions_by_state: Dict[str, Dict[str, GameSessionState]] = {
+            "waiting": {},
+            "active": {},
+            "finished": {},
+        }
+        self.join_codes: Dict[str, str] = {}  # join_code -> game_session_id
+        # Prepended to every join code, so processes sharing the bot never hand out the same code
+        self.join_code_prefix = ""
+        self._spare_join_codes: List[str] = []  # generated codes, prefix included, not handed out yet
+        self.session_locks = KeyedLocks()
+        # state -> seconds a session may stay idle in it, states without a TTL never expire
+        self.idle_ttls: Dict[str, float] = dict(idle_ttls or {})
+        # (expiry check time, game_session_id); a session has one live entry, stale ones are skipped
+        self._expiry_heap: List[Tuple[float, str]] = []
+    
+    def use_store(self, store: SessionStore):
+        """Switch to a session store and restore the sessions it holds"""
+        self.store = store
+        for session in store.load_sessions():
+            self.sessions[session.game_session_id] = session
+            self.sessions_by_state[session.state][session.game_session_id] = session
+            self.session_users[session.game_session_id] = set(session.players)
+            if not session.join_code or session.join_code in self.join_codes:
+                session.join_code = self._claim_join_code(session.game_session_id)
+            else:
+                self.join_codes[session.join_code] = session.game_session_id
+            for telegram_user_id in session.players:
+                self.user_sessions[telegram_user_id] = session.game_session_id
+            # Idle time is not persisted, restored sessions get a full TTL
+            self._schedule_expiry(session)
+        logger.info("Restored {} game sessions".format(len(self.sessions)))
+    
+    def set_idle_ttls(self, idle_ttls: Dict[str, float]):
+        """Set the idle TTL per state and reschedule the expiry of every session"""
+        self.idle_ttls = {state: ttl for state, ttl in idle_ttls.items() if ttl}
+        self._expiry_heap = []
+        for session in self.sessions.values():
+            session.expiry_check_at = None
+            self._schedule_expiry(session)
+    
+    def _expiry_deadline(self, session: GameSessionState) -> Optional[float]:
+        ttl = self.idle_ttls.get(session.state)
+        return session.last_activity + ttl if ttl else None
+    
+    def _schedule_expiry(self, session: GameSessionState):
+        """Make sure the heap looks at a session no later than its expiry deadline
+        
+        Activity only moves the deadline later, so it doesn't touch the heap;
+        the entry is pushed again when it comes due early. Only a state
+        change can bring the deadline forward and push a new entry.
+        """
+        deadline = self._expiry_deadline(session)
+        if deadline is None:
+            return
+        if session.expiry_check_at is None or deadline < session.expiry_check_at:
+            session.expiry_check_at = deadline
+            heapq.heappush(self._expiry_heap, (deadline, session.game_session_id))
+    
+    def is_expired(self, session: GameSessionState, now: Optional[float] = None) -> bool:
+        """Whether a session has been idle for longer than the TTL of its state"""
+        deadline = self._expiry_deadline(session)
+        return deadline is not None and deadline <= (time.monotonic() if now is None else now)
+    
+    def pop_expired_sessions(self, now: Optional[float] = None) -> List[GameSessionState]:
+        """Take the sessions that have been idle past their TTL off the expiry heap
+        
+        The sessions are not removed. Call schedule_expiry on one that turns
+        out to be in use again to keep it under watch.
+        """
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            check_at, game_session_id = heapq.heappop(self._expiry_heap)
+            session = self.sessions.get(game_session_id)
+            if session is None or session.expiry_check_at != check_at:
+                continue
+            session.expiry_check_at = None
+            if self.is_expired(session, now):
+                expired.append(session)
+            else:
+                self._schedule_expiry(session)
+        return expired
+    
+    def schedule_expiry(self, session: GameSessionState):
+        """Watch a session taken by pop_expired_sessions again"""
+        self._schedule_expiry(session)
+    
+    def set_join_code_prefix(self, prefix: str):
+        """Start every join code handed out from now on with prefix"""
+        self.join_code_prefix = prefix
+        self._spare_join_codes = []
+    
+    def _claim_join_code(self, game_session_id: str) -> str:
+        """Register a new join code for a session, one that no other session uses"""
+        while True:
+            if not self._spare_join_codes:
+                self._spare_join_codes = self._join_code_batch()
+            code = self._spare_join_codes.pop()
+            # Checks for a collision and registers the code in one lookup
+            if self.join_codes.setdefault(code, game_session_id) == game_session_id:
+                return code
+    
+    def _join_code_batch(self) -> List[str]:
+        """Generate _JOIN_CODE_BATCH join codes, prefix included
+        
+        Handing out a code is then a pop. The codes are cut in C rather than
+        sliced one by one: each code's prefix and a trailing space are
+        written over the random letters and the batch is split on the spaces.
+        """
+        prefix = self.join_code_prefix.encode()
+        width = len(prefix) + JOIN_CODE_LENGTH + 1
+        batch = bytearray(secrets.token_bytes(width * _JOIN_CODE_BATCH).translate(_JOIN_CODE_TABLE))
+        for position, char in enumerate(prefix):
+            batch[position::width] = bytes([char]) * _JOIN_CODE_BATCH
+        batch[width - 1::width] = b" " * _JOIN_CODE_BATCH
+        return batch.decode().split()
     
-    def create_session(self, game_session_id: str, pack_id: str) -> GameSessionState:
+    def session_lock(self, game_session_id: str):
+        """Serialize updates to one game session; other sessions are unaffected"""
+        return self.session_locks.acquire(game_session_id)
+    
+    def _set_state(self, session: GameSessionState, state: str):
+        """Move a session to a new state, keeping the state index up to date"""
+        self.sessions_by_state[session.state].pop(session.game_session_id, None)
+        session.state = state
+        session.last_activity = time.monotonic()
+        self.sessions_by_state[state][session.game_session_id] = session
+        self._schedule_expiry(session)
+    
+    def create_session(self, game_session_id: str, pack_id: str,
+                       creator_telegram_user_id: Optional[int] = None) -> GameSessionState:
         """Create a new game session state"""
+        if game_session_id in self.sessions:
+            self.remove_session(game_session_id)
+        
         session_state = GameSessionState(
             game_session_id=game_session_id,
             pack_id=pack_id,
-            state="waiting"
+            state="waiting",
+            join_code=self._claim_join_code(game_session_id),
+            creator_telegram_user_id=creator_telegram_user_id
         )
         self.sessions[game_session_id] = session_state
+        self.sessions_by_state["waiting"][game_session_id] = session_state
+        self.session_users[game_session_id] = set()
+        self._schedule_expiry(session_state)
+        self.store.save_session(session_state)
         return session_state
     
     def get_session(self, game_session_id: str) -> Optional[GameSessionState]:
@@ -74,6 +296,21 @@ class GameStateManager:
             return self.sessions.get(game_session_id)
         return None
     
+    def get_session_by_join_code(self, join_code: str) -> Optional[GameSessionState]:
+        """Get a game session by the code players join it with, ignoring case"""
+        game_session_id = self.join_codes.get(join_code.strip().upper())
+        if game_session_id:
+            return self.sessions.get(game_session_id)
+        return None
+    
+    def get_sessions_by_state(self, state: str) -> List[GameSessionState]:
+        """Get all game sessions in a state, oldest first"""
+        return list(self.sessions_by_state[state].values())
+    
+    def count_sessions(self, state: str) -> int:
+        """Count the game sessions in a state"""
+        return len(self.sessions_by_state[state])
+    
     def add_player_to_session(self, game_session_id: str, telegram_user_id: int, 
                              player_id: str, player_name: str) -> bool:
         """Add a player to a game session"""
@@ -86,9 +323,30 @@ class GameStateManager:
             player_name=player_name
         )
         session.players[telegram_user_id] = player_state
+        session.last_activity = time.monotonic()
+        
+        # A user belongs to one session at a time
+        previous_session_id = self.user_sessions.get(telegram_user_id)
+        if previous_session_id is not None and previous_session_id != game_session_id:
+            self.session_users.get(previous_session_id, set()).discard(telegram_user_id)
+        
         self.user_sessions[telegram_user_id] = game_session_id
+        self.session_users[game_session_id].add(telegram_user_id)
+        self.store.save_session(session)
         return True
     
+    def remove_player_from_session(self, game_session_id: str, telegram_user_id: int):
+        """Remove a player from a game session"""
+        session = self.sessions.get(game_session_id)
+        if session:
+            session.players.pop(telegram_user_id, None)
+            session.last_activity = time.monotonic()
+            self.session_users[game_session_id].discard(telegram_user_id)
+            self.store.save_session(session)
+        
+        if self.user_sessions.get(telegram_user_id) == game_session_id:
+            del self.user_sessions[telegram_user_id]
+    
     def get_player_state(self, game_session_id: str, telegram_user_id: int) -> Optional[PlayerState]:
         """Get a player's state in a game session"""
         session = self.sessions.get(game_session_id)
@@ -96,31 +354,41 @@ class GameStateManager:
             return None
         return session.players.get(telegram_user_id)
     
-    def set_session_questions(self, game_session_id: str, questions: List[models_pb2.Question]):
+    def set_session_questions(self, game_session_id: str, questions: List["models_pb2.Question"]):
         """Set questions for a game session"""
         session = self.sessions.get(game_session_id)
         if session:
             session.questions = questions
+            self.store.save_session_content(session)
+    
+    def set_session_variants(self, game_session_id: str, variants: Dict[str, List["models_pb2.Variant"]]):
+        """Set the answer variants of every question in a game session"""
+        session = self.sessions.get(game_session_id)
+        if session:
+            session.variants = variants
+            self.store.save_session_content(session)
     
     def start_session(self, game_session_id: str):
         """Start a game session"""
         session = self.sessions.get(game_session_id)
         if session:
-            session.state = "active"
+            self._set_state(session, "active")
             session.started_at = datetime.now()
             session.current_question_index = 0
             # Reset all players to start at question 0
             for player in session.players.values():
                 player.current_question_index = 0
+            self.store.save_session(session)
     
     def end_session(self, game_session_id: str):
         """End a game session"""
         session = self.sessions.get(game_session_id)
         if session:
-            session.state = "finished"
+            self._set_state(session, "finished")
             session.finished_at = datetime.now()
+            self.store.save_session(session)
     
-    def get_current_question(self, game_session_id: str) -> Optional[models_pb2.Question]:
+    def get_current_question(self, game_session_id: str) -> Optional["models_pb2.Question"]:
         """Get the current question for a game session"""
         session = self.sessions.get(game_session_id)
         if not session or not session.questions:
@@ -130,6 +398,13 @@ class GameStateManager:
             return session.questions[session.current_question_index]
         return None
     
+    def get_current_variants(self, game_session_id: str) -> List["models_pb2.Variant"]:
+        """Get the answer variants of the current question for a game session"""
+        question = self.get_current_question(game_session_id)
+        if not question:
+            return []
+        return self.sessions[game_session_id].variants.get(question.id, [])
+    
     def advance_question(self, game_session_id: str) -> bool:
         """Advance to the next question in a game session"""
         session = self.sessions.get(game_session_id)
@@ -138,9 +413,11 @@ class GameStateManager:
         
         if session.current_question_index < len(session.questions) - 1:
             session.current_question_index += 1
+            session.last_activity = time.monotonic()
             # Advance all players to the next question
             for player in session.players.values():
                 player.current_question_index = session.current_question_index
+            self.store.save_session(session)
             return True
         return False
     
@@ -155,19 +432,45 @@ class GameStateManager:
         if not player_state:
             return
         
-        # Record the answer
-        answer = {
-            "question_id": question_id,
-            "variant_id": variant_id,
-            "is_correct": is_correct,
-            "points": points,
-            "timestamp": datetime.now()
-        }
+        # Record the answer, interning IDs shared by every player of the session
+        answer = AnswerRecord(
+            sys.intern(question_id), sys.intern(variant_id),
+            is_correct, points, time.monotonic_ns()
+        )
         player_state.answers.append(answer)
+        session.last_activity = answer.timestamp_ns / 1e9
         
         # Update score if correct
         if is_correct:
             player_state.score += points
+        
+        self.store.save_answer(game_session_id, telegram_user_id, answer)
+        self.store.save_session(session)
+    
+    def correct_answer(self, game_session_id: str, telegram_user_id: int,
+                       question_id: str, is_correct: bool, points: int) -> bool:
+        """Replace the outcome of a recorded answer, adjusting the player's score"""
+        session = self.sessions.get(game_session_id)
+        player_state = session.players.get(telegram_user_id) if session else None
+        if not player_state:
+            return False
+        
+        for answer in reversed(player_state.answers):
+            if answer.question_id == question_id:
+                break
+        else:
+            return False
+        
+        if answer.is_correct:
+            player_state.score -= answer.points
+        if is_correct:
+            player_state.score += points
+        answer.is_correct = is_correct
+        answer.points = points
+        
+        self.store.save_answer_correction(game_session_id, telegram_user_id, answer)
+        self.store.save_session(session)
+        return True
     
     def get_session_results(self, game_session_id: str) -> List[Dict[str, Any]]:
         """Get the results for a game session"""
@@ -181,7 +484,7 @@ class GameStateManager:
                 "telegram_user_id": telegram_user_id,
                 "player_name": player_state.player_name,
                 "score": player_state.score,
-                "answers": player_state.answers
+                "answers": [answer.to_dict() for answer in player_state.answers]
             })
         
         # Sort by score descending
@@ -195,15 +498,15 @@ class GameStateManager:
             return
         
         # Remove user references to this session
-        users_to_remove = [
-            user_id for user_id, session_id in self.user_sessions.items() 
-            if session_id == game_session_id
-        ]
-        for user_id in users_to_remove:
-            del self.user_sessions[user_id]
+        for user_id in self.session_users.pop(game_session_id, ()):
+            if self.user_sessions.get(user_id) == game_session_id:
+                del self.user_sessions[user_id]
         
         # Remove the session
         del self.sessions[game_session_id]
+        self.join_codes.pop(session.join_code, None)
+        self.sessions_by_state[session.state].pop(game_session_id, None)
+        self.store.delete_session(game_session_id)
 
 
 # Global game state manager instance
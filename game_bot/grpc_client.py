@@ -2,58 +2,101 @@
 gRPC client for communicating with the backend service
 """
 
+import asyncio
 import grpc
+import grpc.aio
+import itertools
+import json
 import logging
-import sys
-import os
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
 
-# Это ключ к работе сгенерированных proto-файлов без их модификации.
-# Мы добавляем корневую директорию сгенерированных пакетов (`game_bot/proto`)
-# в пути поиска Python. Это позволяет импортам вида `import models.models_pb2`
-# внутри сгенерированных файлов работать корректно.
-_CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-_PROTO_DIR = os.path.join(_CURRENT_DIR, 'proto')
-if _PROTO_DIR not in sys.path:
-    sys.path.append(_PROTO_DIR)
-
-from typing import List, Optional
-
-from game_bot.config import BACKEND_GRPC_ADDRESS
+from game_bot.config import (
+    BACKEND_GRPC_ADDRESSES, BACKEND_DEADLINES,
+    CHANNEL_POOL_SIZE, CHANNEL_KEEPALIVE_TIME_MS, CHANNEL_KEEPALIVE_TIMEOUT_MS, CHANNEL_HEALTH_CHECK,
+    RETRY_MAX_ATTEMPTS, RETRY_INITIAL_BACKOFF, RETRY_MAX_BACKOFF,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, STALE_CACHE_SIZE,
+)
+from game_bot.metrics import rpc_errors, rpc_latency
+from game_bot.proto_loader import load_proto_modules
+from game_bot.resilience import CircuitBreaker, CircuitOpenError, backoff_delays, is_transient
+from game_bot.tracing import Span, grpc_metadata, start_span
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def get_deadline(method: str) -> float:
+    """Get the deadline in seconds for an RPC"""
+    return BACKEND_DEADLINES.get(method, BACKEND_DEADLINES.get("default", 5.0))
+
+
+def get_channel_options() -> list:
+    """Build the options shared by every channel to the backend"""
+    service_config = {"loadBalancingConfig": [{"round_robin": {}}]}
+    if CHANNEL_HEALTH_CHECK:
+        service_config["healthCheckConfig"] = {"serviceName": ""}
+    return [
+        ("grpc.service_config", json.dumps(service_config)),
+        # Give every channel its own connections instead of sharing them per target
+        ("grpc.use_local_subchannel_pool", 1),
+        ("grpc.keepalive_time_ms", CHANNEL_KEEPALIVE_TIME_MS),
+        ("grpc.keepalive_timeout_ms", CHANNEL_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+    ]
+
+
+class ChannelPool:
+    """Round-robin pool of channels to one or more backend targets
+
+    Each channel holds its own HTTP/2 connections, so concurrent calls are
+    not capped by the stream limit of a single connection. Channels are
+    assigned to the targets in turn, and within a channel the round_robin
+    policy spreads calls over every address its target resolves to.
+    """
+
+    def __init__(self, targets: List[str], size: int, create_channel: Callable, stub_class: Callable):
+        options = get_channel_options()
+        self.targets = targets
+        self.channels = [
+            create_channel(targets[index % len(targets)], options=options)
+            for index in range(max(size, len(targets)))
+        ]
+        self.stubs = [stub_class(channel) for channel in self.channels]
+        self._counter = itertools.count()
+
+    def next_stub(self):
+        """Pick the stub of the next channel that is not failing to connect"""
+        for _ in range(len(self.stubs)):
+            index = next(self._counter) % len(self.stubs)
+            get_state = getattr(self.channels[index], "get_state", None)
+            if get_state is None or get_state(try_to_connect=True) != grpc.ChannelConnectivity.TRANSIENT_FAILURE:
+                break
+        return self.stubs[index]
+
+
 class GameServiceClient:
     def __init__(self):
-        # Import the generated proto classes inside the constructor
-        # to avoid import errors if proto files haven't been generated yet
-        try:
-            from game_bot.proto.handlers import cruds_pb2, cruds_pb2_grpc
-            from game_bot.proto.models import models_pb2, game_pb2
-            self.cruds_pb2 = cruds_pb2
-            self.cruds_pb2_grpc = cruds_pb2_grpc
-            self.models_pb2 = models_pb2
-            self.game_pb2 = game_pb2
-        except ImportError as e:
-            logger.error("Failed to import proto modules: {}".format(e))
-            logger.error("Make sure you've run the proto generation script: ./generate_proto.sh")
-            raise
-        except SyntaxError as e:
-            logger.error("Syntax error in generated proto files: {}".format(e))
-            logger.error("Try regenerating the proto files with: ./generate_proto.sh")
-            raise
+        (self.cruds_pb2, self.cruds_pb2_grpc,
+         self.models_pb2, self.game_pb2) = load_proto_modules()
         
-        self.channel = grpc.insecure_channel(BACKEND_GRPC_ADDRESS)
-        self.stub = self.cruds_pb2_grpc.QuizServiceStub(self.channel)
-        logger.info("Connected to backend service at {}".format(BACKEND_GRPC_ADDRESS))
+        self.channel_pool = ChannelPool(
+            BACKEND_GRPC_ADDRESSES, CHANNEL_POOL_SIZE,
+            grpc.insecure_channel, self.cruds_pb2_grpc.QuizServiceStub
+        )
+        logger.info("Connected to backend service at {}".format(", ".join(BACKEND_GRPC_ADDRESSES)))
+
+    @property
+    def stub(self):
+        return self.channel_pool.next_stub()
 
     def create_game_session(self, pack_id: str) -> Optional[object]:
         """Create a new game session with the specified pack"""
         try:
             request = self.cruds_pb2.CreateGameSessionRequest(pack_id=pack_id)
-            response = self.stub.CreateGameSession(request)
+            response = self.stub.CreateGameSession(request, timeout=get_deadline("CreateGameSession"))
             return response.game_session
         except grpc.RpcError as e:
             logger.error("Failed to create game session: {}".format(e))
@@ -66,7 +109,7 @@ class GameServiceClient:
         """Get game session by ID"""
         try:
             request = self.cruds_pb2.GetGameSessionRequest(id=game_session_id)
-            response = self.stub.GetGameSession(request)
+            response = self.stub.GetGameSession(request, timeout=get_deadline("GetGameSession"))
             return response.game_session
         except grpc.RpcError as e:
             logger.error("Failed to get game session: {}".format(e))
@@ -79,7 +122,7 @@ class GameServiceClient:
         """Start a game session"""
         try:
             request = self.cruds_pb2.StartGameSessionRequest(id=game_session_id)
-            response = self.stub.StartGameSession(request)
+            response = self.stub.StartGameSession(request, timeout=get_deadline("StartGameSession"))
             return response.game_session
         except grpc.RpcError as e:
             logger.error("Failed to start game session: {}".format(e))
@@ -92,7 +135,7 @@ class GameServiceClient:
         """End a game session"""
         try:
             request = self.cruds_pb2.EndGameSessionRequest(id=game_session_id)
-            response = self.stub.EndGameSession(request)
+            response = self.stub.EndGameSession(request, timeout=get_deadline("EndGameSession"))
             return response.game_session
         except grpc.RpcError as e:
             logger.error("Failed to end game session: {}".format(e))
@@ -105,7 +148,7 @@ class GameServiceClient:
         """Get all available quiz packs"""
         try:
             request = self.cruds_pb2.GetAllPacksRequest()
-            response = self.stub.GetAllPacks(request)
+            response = self.stub.GetAllPacks(request, timeout=get_deadline("GetAllPacks"))
             return list(response.packs)
         except grpc.RpcError as e:
             logger.error("Failed to get packs: {}".format(e))
@@ -118,7 +161,7 @@ class GameServiceClient:
         """Get all questions for a pack"""
         try:
             request = self.cruds_pb2.GetQuestionsByPackIdRequest(pack_id=pack_id)
-            response = self.stub.GetQuestionsByPackId(request)
+            response = self.stub.GetQuestionsByPackId(request, timeout=get_deadline("GetQuestionsByPackId"))
             return list(response.questions)
         except grpc.RpcError as e:
             logger.error("Failed to get questions: {}".format(e))
@@ -131,7 +174,7 @@ class GameServiceClient:
         """Get all variants for a question"""
         try:
             request = self.cruds_pb2.GetVariantsByQuestionIdRequest(question_id=question_id)
-            response = self.stub.GetVariantsByQuestionId(request)
+            response = self.stub.GetVariantsByQuestionId(request, timeout=get_deadline("GetVariantsByQuestionId"))
             return list(response.variants)
         except grpc.RpcError as e:
             logger.error("Failed to get variants: {}".format(e))
@@ -147,7 +190,7 @@ class GameServiceClient:
                 game_session_id=game_session_id,
                 name=player_name
             )
-            response = self.stub.AddPlayer(request)
+            response = self.stub.AddPlayer(request, timeout=get_deadline("AddPlayer"))
             return response.player
         except grpc.RpcError as e:
             logger.error("Failed to add player: {}".format(e))
@@ -160,7 +203,7 @@ class GameServiceClient:
         """Get all players in a game session"""
         try:
             request = self.cruds_pb2.GetPlayersRequest(game_session_id=game_session_id)
-            response = self.stub.GetPlayers(request)
+            response = self.stub.GetPlayers(request, timeout=get_deadline("GetPlayers"))
             return list(response.players)
         except grpc.RpcError as e:
             logger.error("Failed to get players: {}".format(e))
@@ -177,7 +220,7 @@ class GameServiceClient:
                 question_id=question_id,
                 variant_id=variant_id
             )
-            response = self.stub.SubmitAnswer(request)
+            response = self.stub.SubmitAnswer(request, timeout=get_deadline("SubmitAnswer"))
             return response
         except grpc.RpcError as e:
             logger.error("Failed to submit answer: {}".format(e))
@@ -190,7 +233,7 @@ class GameServiceClient:
         """Get all answers submitted by a player"""
         try:
             request = self.cruds_pb2.GetPlayerAnswersRequest(player_id=player_id)
-            response = self.stub.GetPlayerAnswers(request)
+            response = self.stub.GetPlayerAnswers(request, timeout=get_deadline("GetPlayerAnswers"))
             return list(response.answers)
         except grpc.RpcError as e:
             logger.error("Failed to get player answers: {}".format(e))
@@ -200,5 +243,255 @@ class GameServiceClient:
             return []
 
     def close(self):
-        """Close the gRPC channel"""
-        self.channel.close()
\ No newline at end of file
+        """Close the gRPC channels"""
+        for channel in self.channel_pool.channels:
+            channel.close()
+
+
+class AsyncGameServiceClient:
+    """asyncio counterpart of GameServiceClient built on grpc.aio
+
+    Exposes the same methods as coroutines so the bot handlers can await
+    backend calls without blocking the event loop. Must be created from
+    within a running event loop.
+    """
+
+    # Read-only RPCs, safe to retry and to answer from cached responses
+    IDEMPOTENT_METHODS = frozenset([
+        "GetGameSession",
+        "GetAllPacks",
+        "GetQuestionsByPackId",
+        "GetVariantsByQuestionId",
+        "GetPlayers",
+        "GetPlayerAnswers",
+    ])
+
+    def __init__(self):
+        (self.cruds_pb2, self.cruds_pb2_grpc,
+         self.models_pb2, self.game_pb2) = load_proto_modules()
+        
+        self.channel_pool = ChannelPool(
+            BACKEND_GRPC_ADDRESSES, CHANNEL_POOL_SIZE,
+            grpc.aio.insecure_channel, self.cruds_pb2_grpc.QuizServiceStub
+        )
+        logger.info("Connected to backend service at {} (asyncio)".format(", ".join(BACKEND_GRPC_ADDRESSES)))
+        
+        self.circuit_breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        # (method, serialized request) -> last good response of a read RPC
+        self._stale_responses: "OrderedDict[tuple, object]" = OrderedDict()
+
+    @property
+    def stub(self):
+        return self.channel_pool.next_stub()
+
+    async def _call(self, method: str, request):
+        """Call an RPC with a deadline, retrying reads and failing fast while the backend is down
+
+        Read RPCs are retried on transient errors. If they still fail, the
+        last good response to the same request is served instead.
+        """
+        idempotent = method in self.IDEMPOTENT_METHODS
+        cache_key = (method, request.SerializeToString()) if idempotent else None
+        delays = backoff_delays(
+            RETRY_MAX_ATTEMPTS if idempotent else 1, RETRY_INITIAL_BACKOFF, RETRY_MAX_BACKOFF
+        )
+        start = time.perf_counter()
+        with start_span("grpc " + method, rpc_method=method) as span:
+            try:
+                return await self._call_with_retries(method, request, cache_key, delays, span)
+            except grpc.RpcError as e:
+                span.set_attribute("grpc_status", e.code().name)
+                raise
+            finally:
+                rpc_latency.observe(time.perf_counter() - start, method)
+
+    async def _call_with_retries(self, method: str, request, cache_key: Optional[tuple], delays, span: Span):
+        retries = 0
+        while True:
+            try:
+                if not self.circuit_breaker.allow_request():
+                    raise CircuitOpenError("Backend circuit breaker is open, skipping {}".format(method))
+                response = await getattr(self.stub, method)(
+                    request, timeout=get_deadline(method), metadata=grpc_metadata()
+                )
+            except grpc.RpcError as e:
+                rpc_errors.inc(method, e.code().name)
+                transient = is_transient(e) and not isinstance(e, CircuitOpenError)
+                if transient:
+                    self.circuit_breaker.record_failure()
+                elif not isinstance(e, CircuitOpenError):
+                    # The backend answered, it just rejected the request
+                    self.circuit_breaker.record_success()
+                delay = next(delays, None) if transient else None
+                if delay is None:
+                    if is_transient(e) and cache_key in self._stale_responses:
+                        logger.warning("{} failed ({}), serving cached response".format(method, e.code()))
+                        span.set_attribute("stale_response", True)
+                        return self._stale_responses[cache_key]
+                    raise
+                logger.warning("{} failed ({}), retrying in {:.2f}s".format(method, e.code(), delay))
+                retries += 1
+                span.set_attribute("retries", retries)
+                await asyncio.sleep(delay)
+            else:
+                self.circuit_breaker.record_success()
+                if cache_key is not None:
+                    self._stale_responses[cache_key] = response
+                    self._stale_responses.move_to_end(cache_key)
+                    if len(self._stale_responses) > STALE_CACHE_SIZE:
+                        self._stale_responses.popitem(last=False)
+                return response
+
+    async def create_game_session(self, pack_id: str) -> Optional[object]:
+        """Create a new game session with the specified pack"""
+        try:
+            request = self.cruds_pb2.CreateGameSessionRequest(pack_id=pack_id)
+            response = await self._call("CreateGameSession", request)
+            return response.game_session
+        except grpc.RpcError as e:
+            logger.error("Failed to create game session: {}".format(e))
+            return None
+        except Exception as e:
+            logger.error("Unexpected error creating game session: {}".format(e))
+            return None
+
+    async def get_game_session(self, game_session_id: str) -> Optional[object]:
+        """Get game session by ID"""
+        try:
+            request = self.cruds_pb2.GetGameSessionRequest(id=game_session_id)
+            response = await self._call("GetGameSession", request)
+            return response.game_session
+        except grpc.RpcError as e:
+            logger.error("Failed to get game session: {}".format(e))
+            return None
+        except Exception as e:
+            logger.error("Unexpected error getting game session: {}".format(e))
+            return None
+
+    async def start_game_session(self, game_session_id: str) -> Optional[object]:
+        """Start a game session"""
+        try:
+            request = self.cruds_pb2.StartGameSessionRequest(id=game_session_id)
+            response = await self._call("StartGameSession", request)
+            return response.game_session
+        except grpc.RpcError as e:
+            logger.error("Failed to start game session: {}".format(e))
+            return None
+        except Exception as e:
+            logger.error("Unexpected error starting game session: {}".format(e))
+            return None
+
+    async def end_game_session(self, game_session_id: str) -> Optional[object]:
+        """End a game session"""
+        try:
+            request = self.cruds_pb2.EndGameSessionRequest(id=game_session_id)
+            response = await self._call("EndGameSession", request)
+            return response.game_session
+        except grpc.RpcError as e:
+            logger.error("Failed to end game session: {}".format(e))
+            return None
+        except Exception as e:
+            logger.error("Unexpected error ending game session: {}".format(e))
+            return None
+
+    async def get_all_packs(self) -> List[object]:
+        """Get all available quiz packs"""
+        try:
+            request = self.cruds_pb2.GetAllPacksRequest()
+            response = await self._call("GetAllPacks", request)
+            return list(response.packs)
+        except grpc.RpcError as e:
+            logger.error("Failed to get packs: {}".format(e))
+            return []
+        except Exception as e:
+            logger.error("Unexpected error getting packs: {}".format(e))
+            return []
+
+    async def get_questions_by_pack_id(self, pack_id: str) -> List[object]:
+        """Get all questions for a pack"""
+        try:
+            request = self.cruds_pb2.GetQuestionsByPackIdRequest(pack_id=pack_id)
+            response = await self._call("GetQuestionsByPackId", request)
+            return list(response.questions)
+        except grpc.RpcError as e:
+            logger.error("Failed to get questions: {}".format(e))
+            return []
+        except Exception as e:
+            logger.error("Unexpected error getting questions: {}".format(e))
+            return []
+
+    async def get_variants_by_question_id(self, question_id: str) -> List[object]:
+        """Get all variants for a question"""
+        try:
+            request = self.cruds_pb2.GetVariantsByQuestionIdRequest(question_id=question_id)
+            response = await self._call("GetVariantsByQuestionId", request)
+            return list(response.variants)
+        except grpc.RpcError as e:
+            logger.error("Failed to get variants: {}".format(e))
+            return []
+        except Exception as e:
+            logger.error("Unexpected error getting variants: {}".format(e))
+            return []
+
+    async def add_player(self, game_session_id: str, player_name: str) -> Optional[object]:
+        """Add a player to a game session"""
+        try:
+            request = self.cruds_pb2.AddPlayerRequest(
+                game_session_id=game_session_id,
+                name=player_name
+            )
+            response = await self._call("AddPlayer", request)
+            return response.player
+        except grpc.RpcError as e:
+            logger.error("Failed to add player: {}".format(e))
+            return None
+        except Exception as e:
+            logger.error("Unexpected error adding player: {}".format(e))
+            return None
+
+    async def get_players(self, game_session_id: str) -> List[object]:
+        """Get all players in a game session"""
+        try:
+            request = self.cruds_pb2.GetPlayersRequest(game_session_id=game_session_id)
+            response = await self._call("GetPlayers", request)
+            return list(response.players)
+        except grpc.RpcError as e:
+            logger.error("Failed to get players: {}".format(e))
+            return []
+        except Exception as e:
+            logger.error("Unexpected error getting players: {}".format(e))
+            return []
+
+    async def submit_answer(self, player_id: str, question_id: str, variant_id: str) -> Optional[object]:
+        """Submit a player's answer"""
+        try:
+            request = self.cruds_pb2.SubmitAnswerRequest(
+                player_id=player_id,
+                question_id=question_id,
+                variant_id=variant_id
+            )
+            response = await self._call("SubmitAnswer", request)
+            return response
+        except grpc.RpcError as e:
+            logger.error("Failed to submit answer: {}".format(e))
+            return None
+        except Exception as e:
+            logger.error("Unexpected error submitting answer: {}".format(e))
+            return None
+
+    async def get_player_answers(self, player_id: str) -> List[object]:
+        """Get all answers submitted by a player"""
+        try:
+            request = self.cruds_pb2.GetPlayerAnswersRequest(player_id=player_id)
+            response = await self._call("GetPlayerAnswers", request)
+            return list(response.answers)
+        except grpc.RpcError as e:
+            logger.error("Failed to get player answers: {}".format(e))
+            return []
+        except Exception as e:
+            logger.error("Unexpected error getting player answers: {}".format(e))
+            return []
+
+    async def close(self):
+        """Close the gRPC channels"""
+        await asyncio.gather(*(channel.close() for channel in self.channel_pool.channels))
@@ -0,0 +1,232 @@
+"""
+Prometheus-style metrics and the HTTP endpoint that exposes them
+"""
+
+import asyncio
+import bisect
+import functools
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from game_bot import watchdog
+from game_bot.tracing import start_span
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from fast cache hits up to backend deadlines
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric with optional labels, rendered in the text exposition format"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+
+    def render(self) -> List[str]:
+        return [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} {}".format(self.name, self.type_name),
+        ] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            "{}{} {}".format(self.name, _format_labels(self.label_names, labels), _format_value(value))
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Metric):
+    """A value read from a callback whenever the metrics are scraped
+
+    The callback returns a dict mapping label value tuples to values, so
+    gauges never drift from the state they describe.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, label_names)
+        self.collect = collect
+
+    def _samples(self) -> List[str]:
+        values = self.collect() if self.collect else {}
+        return [
+            "{}{} {}".format(self.name, _format_labels(self.label_names, labels), _format_value(value))
+            for labels, value in values.items()
+        ]
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (the last one is +Inf), sum]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append("{}_bucket{} {}".format(
+                    self.name,
+                    _format_labels(self.label_names, labels, 'le="{}"'.format(_format_value(bound))),
+                    cumulative
+                ))
+            samples.append("{}_sum{} {}".format(self.name, _format_labels(self.label_names, labels), repr(total)))
+            samples.append("{}_count{} {}".format(self.name, _format_labels(self.label_names, labels), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """The set of metrics exposed on /metrics"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error("Error collecting metric {}: {}".format(metric.name, e))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+handler_latency = registry.register(Histogram(
+    "game_bot_handler_duration_seconds", "Time spent in a Telegram update handler", ["handler"]
+))
+handler_errors = registry.register(Counter(
+    "game_bot_handler_errors_total", "Handler calls that raised an exception", ["handler"]
+))
+rpc_latency = registry.register(Histogram(
+    "game_bot_rpc_duration_seconds", "Time until a backend RPC returned, including retries", ["method"]
+))
+rpc_errors = registry.register(Counter(
+    "game_bot_rpc_errors_total", "Failed backend RPC attempts by status code", ["method", "code"]
+))
+loop_lag = registry.register(Histogram(
+    "game_bot_event_loop_lag_seconds", "How late the event loop ran a timer it was asked to run"
+))
+
+
+def instrumented(handler: Callable) -> Callable:
+    """Record the latency and errors of an async handler under its name
+
+    The handler runs in a span, the root of the trace of its update unless
+    another instrumented handler called it. Slow calls are logged and the
+    handler selected in the watchdog config is profiled.
+    """
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        update = args[0] if args else None
+        start = time.perf_counter()
+        with start_span(name) as span:
+            if getattr(update, "update_id", None) is not None:
+                span.set_attribute("update_id", update.update_id)
+            if getattr(update, "effective_user", None) is not None:
+                span.set_attribute("user_id", update.effective_user.id)
+            try:
+                with watchdog.profiled(name):
+                    return await handler(*args, **kwargs)
+            except Exception:
+                handler_errors.inc(name)
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                handler_latency.observe(duration, name)
+                watchdog.handler_finished(name, duration)
+
+    return wrapper
+
+
+async def _handle_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        # Skip the headers, the request has no body we care about
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not Found\n"
+        writer.write(
+            "HTTP/1.1 {}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            "Content-Length: {}\r\nConnection: close\r\n\r\n".format(status, len(body)).encode()
+            + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.AbstractServer:
+    """Serve the registry on http://host:port/metrics from the running event loop"""
+    server = await asyncio.start_server(_handle_request, host, port)
+    logger.info("Serving metrics on http://{}:{}/metrics".format(host, port))
+    return server
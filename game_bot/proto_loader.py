@@ -0,0 +1,41 @@
+"""
+Lazy loading of the generated protobuf modules
+"""
+
+import functools
+import logging
+import os
+import sys
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Это ключ к работе сгенерированных proto-файлов без их модификации.
+# Мы добавляем корневую директорию сгенерированных пакетов (`game_bot/proto`)
+# в пути поиска Python. Это позволяет импортам вида `import models.models_pb2`
+# внутри сгенерированных файлов работать корректно.
+_PROTO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'proto')
+
+
+@functools.lru_cache(maxsize=None)
+def load_proto_modules():
+    """Import the generated proto modules on first use, logging a hint if they are missing
+
+    Returns (cruds_pb2, cruds_pb2_grpc, models_pb2, game_pb2). Nothing is
+    imported until the first backend call, which keeps protobuf and the
+    generated code off the startup path.
+    """
+    if _PROTO_DIR not in sys.path:
+        sys.path.append(_PROTO_DIR)
+    try:
+        from game_bot.proto.handlers import cruds_pb2, cruds_pb2_grpc
+        from game_bot.proto.models import models_pb2, game_pb2
+        return cruds_pb2, cruds_pb2_grpc, models_pb2, game_pb2
+    except ImportError as e:
+        logger.error("Failed to import proto modules: {}".format(e))
+        logger.error("Make sure you've run the proto generation script: ./generate_proto.sh")
+        raise
+    except SyntaxError as e:
+        logger.error("Syntax error in generated proto files: {}".format(e))
+        logger.error("Try regenerating the proto files with: ./generate_proto.sh")
+        raise
@@ -0,0 +1,99 @@
+"""
+Failure handling for backend calls: retry backoff and a circuit breaker
+"""
+
+import logging
+import random
+import time
+from typing import Iterator, Optional
+
+import grpc
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Status codes that indicate an unhealthy or overloaded backend rather than a bad request
+TRANSIENT_STATUS_CODES = frozenset([
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+])
+
+
+class CircuitOpenError(grpc.RpcError):
+    """Raised instead of calling the backend while the circuit breaker is open"""
+
+    def code(self) -> grpc.StatusCode:
+        return grpc.StatusCode.UNAVAILABLE
+
+    def details(self) -> str:
+        return str(self)
+
+
+def is_transient(error: Exception) -> bool:
+    """Check whether an RPC error is worth retrying"""
+    code = getattr(error, "code", None)
+    return callable(code) and code() in TRANSIENT_STATUS_CODES
+
+
+def backoff_delays(attempts: int, initial_backoff: float, max_backoff: float) -> Iterator[float]:
+    """Yield the delays before each retry: exponential backoff with full jitter"""
+    for retry in range(attempts - 1):
+        yield random.uniform(0, min(max_backoff, initial_backoff * 2 ** retry))
+
+
+class CircuitBreaker:
+    """Stops calling a failing backend until it had time to recover
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast. Once reset_timeout seconds have passed a single trial call is
+    let through (half-open) while every other call keeps failing fast; its
+    success closes the circuit and its failure opens it for another
+    reset_timeout. A trial that never reports back, e.g. because its caller
+    was cancelled, is given up on after reset_timeout and another one is let
+    through.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        # When the trial call of the half-open state was let through, None when there is none
+        self.trial_started_at: Optional[float] = None
+
+    def allow_request(self) -> bool:
+        """Check whether a call may go to the backend"""
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self.trial_started_at = None
+        if self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout:
+            return False
+        self.trial_started_at = now
+        return True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("Backend recovered, closing circuit breaker")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trial_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Backend unhealthy after {} failures, opening circuit breaker".format(self.failures))
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.trial_started_at = None
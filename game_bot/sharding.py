@@ -0,0 +1,271 @@
+"""
+Multi-process mode: a front process routes updates to shard workers
+
+Each worker process runs the bot handlers with its own GameStateManager,
+so game sessions are spread over several cores. The front process receives
+updates from Telegram and forwards each one to the worker that owns the
+sender's game session. Users that are not in a game are placed on the
+ring by a consistent hash of their chat ID. Workers report session
+ownership and membership back to the front process through an event queue.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+
+from game_bot.config import (
+    STORAGE_SQLITE_PATH, SHARD_VIRTUAL_NODES, METRICS_PORT, TRACING_PATH, PROFILE_PATH, BROADCAST_GLOBAL_RATE,
+)
+from game_bot.game_state import JOIN_CODE_ALPHABET
+from game_bot.storage import SessionStore
+
+if TYPE_CHECKING:
+    from game_bot.game_state import AnswerRecord, GameSessionState
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """Maps keys to nodes so that adding a node only moves a fraction of keys"""
+
+    def __init__(self, nodes: Iterable[int], virtual_nodes: int = 100):
+        points = sorted(
+            (_hash("{}#{}".format(node, replica)), node)
+            for node in nodes
+            for replica in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get_node(self, key: str) -> int:
+        """Get the node that owns a key"""
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+class ShardRouter:
+    """Decides which worker handles an update"""
+
+    def __init__(self, shard_count: int, virtual_nodes: int = 100):
+        self.shard_count = shard_count
+        self.ring = ConsistentHashRing(range(shard_count), virtual_nodes)
+        self.session_shards: Dict[str, int] = {}  # game_session_id -> shard
+        self.session_users: Dict[str, Tuple[int, ...]] = {}  # game_session_id -> telegram_user_ids
+        self.user_sessions: Dict[int, str] = {}  # telegram_user_id -> game_session_id
+
+    def apply_event(self, event: Tuple):
+        """Apply a session event reported by a worker"""
+        kind, shard, game_session_id = event[:3]
+        if kind == "session":
+            user_ids = event[4]
+            self.session_shards[game_session_id] = shard
+            self._set_users(game_session_id, user_ids)
+        elif kind == "removed":
+            self._set_users(game_session_id, ())
+            self.session_shards.pop(game_session_id, None)
+            self.session_users.pop(game_session_id, None)
+
+    def route(self, update: Update) -> int:
+        """Get the shard an update should be handled by"""
+        user = update.effective_user
+        game_session_id = self.user_sessions.get(user.id) if user else None
+        if game_session_id is not None:
+            return self.session_shards[game_session_id]
+
+        # /join <code> and /start <code> go to the shard that handed out the code
+        message = update.effective_message
+        words = message.text.split() if message and message.text else ()
+        if len(words) > 1 and words[0].split("@")[0] in ("/join", "/start"):
+            shard = JOIN_CODE_ALPHABET.find(words[1][:1].upper())
+            if 0 <= shard < self.shard_count:
+                return shard
+
+        chat = update.effective_chat
+        if chat:
+            key = chat.id
+        elif user:
+            key = user.id
+        else:
+            key = update.update_id
+        return self.ring.get_node(str(key))
+
+    def _set_users(self, game_session_id: str, user_ids: Tuple[int, ...]):
+        for user_id in self.session_users.get(game_session_id, ()):
+            if self.user_sessions.get(user_id) == game_session_id:
+                del self.user_sessions[user_id]
+        self.session_users[game_session_id] = tuple(user_ids)
+        for user_id in user_ids:
+            self.user_sessions[user_id] = game_session_id
+
+
+class ShardReportingStore(SessionStore):
+    """Session store wrapper that reports ownership changes to the front process"""
+
+    def __init__(self, store: SessionStore, shard_index: int, event_queue):
+        self.store = store
+        self.shard_index = shard_index
+        self.event_queue = event_queue
+        self._reported: Dict[str, Tuple] = {}  # game_session_id -> (state, user_ids)
+
+    def load_sessions(self) -> List["GameSessionState"]:
+        sessions = self.store.load_sessions()
+        for session in sessions:
+            self._report(session)
+        return sessions
+
+    def save_session(self, session: "GameSessionState"):
+        self.store.save_session(session)
+        self._report(session)
+
+    def save_session_content(self, session: "GameSessionState"):
+        self.store.save_session_content(session)
+
+    def save_answer(self, game_session_id: str, telegram_user_id: int, answer: "AnswerRecord"):
+        self.store.save_answer(game_session_id, telegram_user_id, answer)
+
+    def save_answer_correction(self, game_session_id: str, telegram_user_id: int, answer: "AnswerRecord"):
+        self.store.save_answer_correction(game_session_id, telegram_user_id, answer)
+
+    def delete_session(self, game_session_id: str):
+        self.store.delete_session(game_session_id)
+        if self._reported.pop(game_session_id, None) is not None:
+            self.event_queue.put(("removed", self.shard_index, game_session_id))
+
+    def flush(self):
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
+
+    def _report(self, session: "GameSessionState"):
+        # Only state and membership matter for routing, skip score updates
+        summary = (session.state, tuple(session.players))
+        if self._reported.get(session.game_session_id) != summary:
+            self._reported[session.game_session_id] = summary
+            self.event_queue.put(("session", self.shard_index, session.game_session_id) + summary)
+
+
+def shard_file_path(path: str, shard_index: int) -> str:
+    """Get the path of a shard's own copy of a file"""
+    root, ext = os.path.splitext(path)
+    return "{}.shard{}{}".format(root, shard_index, ext)
+
+
+def shard_sqlite_path(shard_index: int) -> str:
+    """Get the SQLite database path used by a shard"""
+    return shard_file_path(STORAGE_SQLITE_PATH, shard_index)
+
+
+def run_worker(shard_index: int, worker_count: int, update_queue, event_queue):
+    """Entry point of a shard worker process"""
+    # The front process coordinates shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve_shard(shard_index, worker_count, update_queue, event_queue))
+
+
+async def _serve_shard(shard_index: int, worker_count: int, update_queue, event_queue):
+    from game_bot import bot
+    from game_bot.game_state import game_state_manager
+
+    # The first character of a join code tells the front process which shard owns the game
+    game_state_manager.set_join_code_prefix(JOIN_CODE_ALPHABET[shard_index])
+    game_state_manager.use_store(ShardReportingStore(
+        bot.create_session_store(shard_sqlite_path(shard_index)), shard_index, event_queue
+    ))
+
+    # All workers send as the same bot, so they share its global message rate
+    bot.broadcaster.set_global_rate(BROADCAST_GLOBAL_RATE / worker_count)
+
+    application = bot.build_application(with_updater=False)
+    # Every worker serves its own metrics next to the configured port
+    application.bot_data["metrics_port"] = METRICS_PORT + 1 + shard_index
+    application.bot_data["trace_path"] = shard_file_path(TRACING_PATH, shard_index)
+    application.bot_data["profile_path"] = shard_file_path(PROFILE_PATH, shard_index)
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        logger.info("Shard {} ready".format(shard_index))
+
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await loop.run_in_executor(None, update_queue.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+
+        await application.stop()
+        await bot.post_shutdown(application)
+    logger.info("Shard {} stopped".format(shard_index))
+
+
+def run_sharded(worker_count: int):
+    """Run a front process that routes updates to worker_count shard workers"""
+    from game_bot import bot
+
+    if worker_count > len(JOIN_CODE_ALPHABET):
+        raise ValueError("At most {} shard workers are supported".format(len(JOIN_CODE_ALPHABET)))
+
+    # Spawn rather than fork, gRPC does not survive a fork
+    mp_context = multiprocessing.get_context("spawn")
+    event_queue = mp_context.Queue()
+    update_queues = [mp_context.Queue() for _ in range(worker_count)]
+    workers = [
+        mp_context.Process(
+            target=run_worker, args=(shard_index, worker_count, update_queues[shard_index], event_queue),
+            name="shard-{}".format(shard_index), daemon=True
+        )
+        for shard_index in range(worker_count)
+    ]
+    for worker in workers:
+        worker.start()
+
+    router = ShardRouter(worker_count, SHARD_VIRTUAL_NODES)
+
+    async def forward_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        update_queues[router.route(update)].put(update.to_dict())
+
+    async def consume_events():
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await loop.run_in_executor(None, event_queue.get)
+            if event is None:
+                break
+            router.apply_event(event)
+
+    async def post_init(application: Application):
+        application.bot_data["event_task"] = asyncio.create_task(consume_events())
+
+    async def post_shutdown(application: Application):
+        event_queue.put(None)
+        await application.bot_data["event_task"]
+
+    application = (
+        bot.application_builder()
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, forward_update))
+
+    logger.info("Starting Telegram bot with {} shard workers...".format(worker_count))
+    try:
+        bot.run_application(application)
+    finally:
+        for update_queue in update_queues:
+            update_queue.put(None)
+        for worker in workers:
+            worker.join(timeout=10)
@@ -0,0 +1,327 @@
+"""
+Storage backends that persist game session state
+"""
+
+import logging
+import pickle
+import sqlite3
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    # Only for annotations, game_state imports this module
+    from game_bot.game_state import AnswerRecord, GameSessionState
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """Interface for persisting the state held by GameStateManager
+
+    GameStateManager always works on its in-memory dicts and reports every
+    change to its store. A store decides how (and how often) those changes
+    reach durable storage and hands the sessions back on restart.
+    """
+
+    def load_sessions(self) -> List["GameSessionState"]:
+        """Load all persisted game sessions"""
+        raise NotImplementedError
+
+    def save_session(self, session: "GameSessionState"):
+        """Persist a session's state, progress and players"""
+        raise NotImplementedError
+
+    def save_session_content(self, session: "GameSessionState"):
+        """Persist a session's questions and variants"""
+        raise NotImplementedError
+
+    def save_answer(self, game_session_id: str, telegram_user_id: int, answer: "AnswerRecord"):
+        """Persist a recorded answer"""
+        raise NotImplementedError
+
+    def save_answer_correction(self, game_session_id: str, telegram_user_id: int, answer: "AnswerRecord"):
+        """Persist a corrected score for an answer that was already saved"""
+        raise NotImplementedError
+
+    def delete_session(self, game_session_id: str):
+        """Delete a session and everything recorded for it"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Write out any buffered changes"""
+
+    def close(self):
+        """Flush buffered changes and release resources"""
+        self.flush()
+
+
+class MemorySessionStore(SessionStore):
+    """Keeps game state only in the GameStateManager dicts of this process"""
+
+    def load_sessions(self) -> List["GameSessionState"]:
+        return []
+
+    def save_session(self, session: "GameSessionState"):
+        pass
+
+    def save_session_content(self, session: "GameSessionState"):
+        pass
+
+    def save_answer(self, game_session_id: str, telegram_user_id: int, answer: "AnswerRecord"):
+        pass
+
+    def save_answer_correction(self, game_session_id: str, telegram_user_id: int, answer: "AnswerRecord"):
+        pass
+
+    def delete_session(self, game_session_id: str):
+        pass
+
+
+class SQLiteSessionStore(SessionStore):
+    """Persists game state to a SQLite database in WAL mode
+
+    Changes are buffered and committed in one transaction once batch_size
+    changes are pending or flush_interval seconds have passed since the last
+    commit. Repeated changes to a session between commits are coalesced into
+    a single write of its latest state.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            game_session_id TEXT PRIMARY KEY,
+            pack_id TEXT NOT NULL,
+            state TEXT NOT NULL,
+            current_question_index INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            content BLOB,
+            join_code TEXT,
+            creator_telegram_user_id INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS players (
+            game_session_id TEXT NOT NULL,
+            telegram_user_id INTEGER NOT NULL,
+            player_id TEXT NOT NULL,
+            player_name TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            current_question_index INTEGER NOT NULL,
+            PRIMARY KEY (game_session_id, telegram_user_id)
+        );
+        CREATE TABLE IF NOT EXISTS answers (
+            game_session_id TEXT NOT NULL,
+            telegram_user_id INTEGER NOT NULL,
+            question_id TEXT NOT NULL,
+            variant_id TEXT NOT NULL,
+            is_correct INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            answered_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS answers_by_session ON answers (game_session_id);
+    """
+
+    def __init__(self, path: str, batch_size: int = 200, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.SCHEMA)
+        # Databases created by older versions lack the newer columns
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(sessions)")]
+        for column, column_type in (("join_code", "TEXT"), ("creator_telegram_user_id", "INTEGER")):
+            if column not in columns:
+                self.connection.execute("ALTER TABLE sessions ADD COLUMN {} {}".format(column, column_type))
+        self.connection.commit()
+
+        self._dirty_sessions: Dict[str, "GameSessionState"] = {}
+        self._dirty_content: Dict[str, "GameSessionState"] = {}
+        self._pending_answers: List[Tuple] = []
+        self._pending_corrections: List[Tuple] = []
+        self._deleted_sessions: Set[str] = set()
+        self._pending_changes = 0
+        self._last_flush = time.monotonic()
+        logger.info("Using SQLite session store at {}".format(path))
+
+    def load_sessions(self) -> List["GameSessionState"]:
+        from game_bot.game_state import AnswerRecord, GameSessionState, PlayerState
+        from game_bot.proto_loader import load_proto_modules
+
+        self.flush()
+        sessions: Dict[str, GameSessionState] = {}
+        rows = self.connection.execute(
+            "SELECT game_session_id, pack_id, state, current_question_index, "
+            "created_at, started_at, finished_at, content, join_code, creator_telegram_user_id FROM sessions"
+        )
+        for (game_session_id, pack_id, state, current_question_index,
+             created_at, started_at, finished_at, content, join_code, creator_telegram_user_id) in rows:
+            session = GameSessionState(
+                game_session_id=game_session_id,
+                pack_id=pack_id,
+                state=state,
+                join_code=join_code,
+                creator_telegram_user_id=creator_telegram_user_id,
+                current_question_index=current_question_index,
+                created_at=datetime.fromisoformat(created_at),
+                started_at=_parse_datetime(started_at),
+                finished_at=_parse_datetime(finished_at),
+            )
+            if content is not None:
+                # The pickled messages reference the generated proto modules
+                load_proto_modules()
+                session.questions, session.variants = pickle.loads(content)
+            sessions[game_session_id] = session
+
+        rows = self.connection.execute(
+            "SELECT game_session_id, telegram_user_id, player_id, player_name, "
+            "score, current_question_index FROM players"
+        )
+        for (game_session_id, telegram_user_id, player_id, player_name,
+             score, current_question_index) in rows:
+            session = sessions.get(game_session_id)
+            if session:
+                session.players[telegram_user_id] = PlayerState(
+                    player_id=player_id,
+                    player_name=player_name,
+                    score=score,
+                    current_question_index=current_question_index
+                )
+
+        rows = self.connection.execute(
+            "SELECT game_session_id, telegram_user_id, question_id, variant_id, "
+            "is_correct, points, answered_at FROM answers ORDER BY rowid"
+        )
+        for (game_session_id, telegram_user_id, question_id, variant_id,
+             is_correct, points, answered_at) in rows:
+            session = sessions.get(game_session_id)
+            player_state = session.players.get(telegram_user_id) if session else None
+            if player_state:
+                player_state.answers.append(AnswerRecord.from_datetime(
+                    question_id, variant_id, bool(is_correct), points,
+                    datetime.fromtimestamp(answered_at)
+                ))
+
+        return list(sessions.values())
+
+    def save_session(self, session: "GameSessionState"):
+        self._dirty_sessions[session.game_session_id] = session
+        self._changed()
+
+    def save_session_content(self, session: "GameSessionState"):
+        self._dirty_sessions[session.game_session_id] = session
+        self._dirty_content[session.game_session_id] = session
+        self._changed()
+
+    def save_answer(self, game_session_id: str, telegram_user_id: int, answer: "AnswerRecord"):
+        self._pending_answers.append((
+            game_session_id, telegram_user_id, answer.question_id, answer.variant_id,
+            int(answer.is_correct), answer.points, answer.timestamp.timestamp()
+        ))
+        self._changed()
+
+    def save_answer_correction(self, game_session_id: str, telegram_user_id: int, answer: "AnswerRecord"):
+        self._pending_corrections.append((
+            int(answer.is_correct), answer.points,
+            game_session_id, telegram_user_id, answer.question_id
+        ))
+        self._changed()
+
+    def delete_session(self, game_session_id: str):
+        self._dirty_sessions.pop(game_session_id, None)
+        self._dirty_content.pop(game_session_id, None)
+        self._pending_answers = [
+            answer for answer in self._pending_answers if answer[0] != game_session_id
+        ]
+        self._pending_corrections = [
+            correction for correction in self._pending_corrections if correction[2] != game_session_id
+        ]
+        self._deleted_sessions.add(game_session_id)
+        self._changed()
+
+    def flush(self):
+        if not self._pending_changes:
+            return
+
+        with self.connection:
+            # Deletes go first so a session re-created since is written afresh
+            for game_session_id in self._deleted_sessions:
+                self.connection.execute("DELETE FROM sessions WHERE game_session_id = ?", (game_session_id,))
+                self.connection.execute("DELETE FROM players WHERE game_session_id = ?", (game_session_id,))
+                self.connection.execute("DELETE FROM answers WHERE game_session_id = ?", (game_session_id,))
+
+            self.connection.executemany(
+                "INSERT INTO sessions (game_session_id, pack_id, state, current_question_index, "
+                "created_at, started_at, finished_at, join_code, creator_telegram_user_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (game_session_id) DO UPDATE SET state = excluded.state, "
+                "current_question_index = excluded.current_question_index, "
+                "started_at = excluded.started_at, finished_at = excluded.finished_at, "
+                "join_code = excluded.join_code",
+                [
+                    (session.game_session_id, session.pack_id, session.state,
+                     session.current_question_index, session.created_at.isoformat(),
+                     _format_datetime(session.started_at), _format_datetime(session.finished_at),
+                     session.join_code, session.creator_telegram_user_id)
+                    for session in self._dirty_sessions.values()
+                ]
+            )
+            self.connection.executemany(
+                "UPDATE sessions SET content = ? WHERE game_session_id = ?",
+                [
+                    (pickle.dumps((session.questions, session.variants)), session.game_session_id)
+                    for session in self._dirty_content.values()
+                ]
+            )
+            self.connection.executemany(
+                "DELETE FROM players WHERE game_session_id = ?",
+                [(game_session_id,) for game_session_id in self._dirty_sessions]
+            )
+            self.connection.executemany(
+                "INSERT INTO players (game_session_id, telegram_user_id, player_id, player_name, "
+                "score, current_question_index) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (session.game_session_id, telegram_user_id, player.player_id,
+                     player.player_name, player.score, player.current_question_index)
+                    for session in self._dirty_sessions.values()
+                    for telegram_user_id, player in session.players.items()
+                ]
+            )
+            self.connection.executemany(
+                "INSERT INTO answers (game_session_id, telegram_user_id, question_id, variant_id, "
+                "is_correct, points, answered_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._pending_answers
+            )
+            self.connection.executemany(
+                "UPDATE answers SET is_correct = ?, points = ? "
+                "WHERE game_session_id = ? AND telegram_user_id = ? AND question_id = ?",
+                self._pending_corrections
+            )
+
+        self._dirty_sessions.clear()
+        self._dirty_content.clear()
+        self._pending_answers = []
+        self._pending_corrections = []
+        self._deleted_sessions.clear()
+        self._pending_changes = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def _changed(self):
+        self._pending_changes += 1
+        if (self._pending_changes >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+
+def _format_datetime(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
@@ -0,0 +1,91 @@
+"""
+Timer scheduler for many concurrent timeouts
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class TimerScheduler:
+    """Runs coroutine callbacks at deadlines, at most one timer per key
+
+    All timers share a heap and a single event-loop timer armed for the
+    earliest deadline, so thousands of games cost thousands of heap entries
+    rather than thousands of sleeping tasks. Rescheduling or cancelling a
+    key leaves its old heap entry behind; stale entries are skipped when
+    they come due.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        # key -> (deadline, sequence number of its live heap entry, callback, args)
+        self._timers: Dict[Hashable, Tuple[float, int, Callable, tuple]] = {}
+        self._sequence = itertools.count()
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._handle_deadline: Optional[float] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable, *args: Any):
+        """Run callback(*args) in delay seconds, replacing the timer of key if there is one"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + delay
+        sequence = next(self._sequence)
+        self._timers[key] = (deadline, sequence, callback, args)
+        heapq.heappush(self._heap, (deadline, sequence, key))
+        if self._handle_deadline is None or deadline < self._handle_deadline:
+            self._arm(loop, deadline)
+
+    def cancel(self, key: Hashable):
+        """Drop the timer of key if there is one"""
+        self._timers.pop(key, None)
+
+    async def close(self):
+        """Drop every timer and wait for callbacks that are already running"""
+        self._timers.clear()
+        self._heap.clear()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = self._handle_deadline = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _arm(self, loop: asyncio.AbstractEventLoop, deadline: float):
+        if self._handle is not None:
+            self._handle.cancel()
+        # An empty context, so callbacks don't inherit the span of whoever armed the timer
+        self._handle = loop.call_at(deadline, self._fire, context=contextvars.Context())
+        self._handle_deadline = deadline
+
+    def _fire(self):
+        loop = asyncio.get_running_loop()
+        self._handle = self._handle_deadline = None
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, sequence, key = heapq.heappop(self._heap)
+            timer = self._timers.get(key)
+            if timer is None or timer[1] != sequence:
+                continue
+            del self._timers[key]
+            task = loop.create_task(timer[2](*timer[3]))
+            self._tasks.add(task)
+            task.add_done_callback(self._finished)
+        # Cancelled timers at the top would only cause empty wake-ups
+        while self._heap and self._timers.get(self._heap[0][2], (None, None))[1] != self._heap[0][1]:
+            heapq.heappop(self._heap)
+        if self._heap:
+            self._arm(loop, self._heap[0][0])
+
+    def _finished(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error in timer callback: {}".format(task.exception()))
@@ -0,0 +1,162 @@
+"""
+Lightweight tracing of updates, handlers and backend calls
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, Iterator, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled",
+                 "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, object] = {}
+        self.status = "OK"
+
+    def set_attribute(self, key: str, value: object):
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        """The W3C traceparent header value that makes this span the parent of a remote one"""
+        return "00-{}-{}-{}".format(self.trace_id, self.span_id, "01" if self.sampled else "00")
+
+    def to_dict(self) -> dict:
+        """Convert the span to the JSON shape of an OTLP span"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class _NoopSpan(Span):
+    """Stands in for every span while tracing is disabled, so it costs nothing"""
+
+    __slots__ = ()
+
+    def __init__(self):
+        pass
+
+    def set_attribute(self, key: str, value: object):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class JsonLinesExporter:
+    """Appends finished spans to a file, one JSON object per line
+
+    Stands in for an OTLP collector: the file can be inspected directly or
+    shipped to one. Spans are buffered and written once buffer_size spans
+    are pending or flush_interval seconds have passed.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 100, flush_interval: float = 1.0):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._file = open(path, "a", encoding="utf-8")
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+        logger.info("Writing traces to {}".format(path))
+
+    def export(self, span: Span):
+        self._buffer.append(json.dumps(span.to_dict(), default=str))
+        if (len(self._buffer) >= self.buffer_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._file.flush()
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+# The span of the operation running in the current task
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+_exporter: Optional[JsonLinesExporter] = None
+_sample_rate = 1.0
+
+
+def configure(exporter: Optional[JsonLinesExporter], sample_rate: float = 1.0):
+    """Start exporting spans, or stop when exporter is None"""
+    global _exporter, _sample_rate
+    if _exporter is not None and _exporter is not exporter:
+        _exporter.close()
+    _exporter = exporter
+    _sample_rate = sample_rate
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextlib.contextmanager
+def start_span(name: str, **attributes) -> Iterator[Span]:
+    """Run the block in a child span of the current one, or a new trace if there is none
+
+    While tracing is disabled no span is created: the block gets a shared
+    no-op span and no trace context reaches the backend.
+    """
+    if _exporter is None:
+        yield _NOOP_SPAN
+        return
+    parent = _current_span.get()
+    if parent is None:
+        span = Span(name, os.urandom(16).hex(), None,
+                    _exporter is not None and random.random() < _sample_rate)
+    else:
+        span = Span(name, parent.trace_id, parent.span_id, parent.sampled)
+    span.attributes.update(attributes)
+
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = "ERROR"
+        span.set_attribute("error", repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end_ns = time.time_ns()
+        if span.sampled and _exporter is not None:
+            _exporter.export(span)
+
+
+def grpc_metadata() -> tuple:
+    """Metadata that carries the current trace context to the backend"""
+    span = _current_span.get()
+    return (("traceparent", span.traceparent()),) if span is not None else ()
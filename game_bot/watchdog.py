@@ -0,0 +1,147 @@
+"""
+Event-loop blocking detection and handler profiling
+"""
+
+import asyncio
+import contextlib
+import cProfile
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Iterator, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    """Measures event-loop lag and reports what blocked the loop
+
+    A task on the loop wakes up every interval and records how late it
+    was. A thread checks that those wake-ups keep coming; once the loop has
+    been stuck for threshold seconds it logs the stack of the loop thread
+    and the task that was running, once per stall.
+    """
+
+    def __init__(self, interval: float, threshold: float, on_lag: Optional[Callable[[float], None]] = None):
+        self.interval = interval
+        self.threshold = threshold
+        self.on_lag = on_lag
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id = 0
+        self._heartbeat = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Start watching the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._heartbeat = now = time.monotonic()
+            if self.on_lag is not None:
+                self.on_lag(max(0.0, now - expected))
+
+    def _watch(self):
+        reported_heartbeat = None
+        while not self._stopping.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for >= self.threshold and heartbeat != reported_heartbeat:
+                reported_heartbeat = heartbeat
+                self._report(blocked_for)
+
+    def _report(self, blocked_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "<stack unavailable>\n"
+        task = asyncio.current_task(self._loop)
+        if task is not None:
+            coro = task.get_coro()
+            running = "{} ({})".format(task.get_name(), getattr(coro, "__qualname__", coro))
+        else:
+            running = "a callback outside any task"
+        logger.warning("Event loop blocked for over {:.3f}s by {}:\n{}".format(blocked_for, running, stack.rstrip()))
+
+
+class HandlerProfiler:
+    """Runs one handler under cProfile and dumps the stats periodically
+
+    While any call of the handler is in progress the profiler is enabled for
+    the whole thread, so coroutines interleaved with it are profiled too.
+    """
+
+    def __init__(self, handler_name: str, path: str, dump_every: int = 100):
+        self.handler_name = handler_name
+        self.path = path
+        self.dump_every = dump_every
+        self.profile = cProfile.Profile()
+        self.calls = 0
+        self._active = 0
+
+    @contextlib.contextmanager
+    def profiling(self) -> Iterator[None]:
+        if self._active == 0:
+            self.profile.enable()
+        self._active += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            if self._active == 0:
+                self.profile.disable()
+            self.calls += 1
+            if self.calls % self.dump_every == 0:
+                self.dump()
+
+    def dump(self):
+        self.profile.dump_stats(self.path)
+        logger.info("Wrote profile of {} calls of {} to {}".format(self.calls, self.handler_name, self.path))
+
+
+_slow_handler_threshold: Optional[float] = None
+_profiler: Optional[HandlerProfiler] = None
+
+
+def configure(slow_handler_threshold: Optional[float], profiler: Optional[HandlerProfiler] = None):
+    """Set the slow handler threshold and the handler profiler, dumping the previous one"""
+    global _slow_handler_threshold, _profiler
+    if _profiler is not None and _profiler is not profiler and _profiler.calls % _profiler.dump_every:
+        _profiler.dump()
+    _slow_handler_threshold = slow_handler_threshold
+    _profiler = profiler
+
+
+def profiled(handler_name: str):
+    """Profile the block if handler_name is the handler selected for profiling"""
+    if _profiler is not None and _profiler.handler_name == handler_name:
+        return _profiler.profiling()
+    return contextlib.nullcontext()
+
+
+def handler_finished(handler_name: str, duration: float):
+    """Log a handler call that took longer than the slow handler threshold"""
+    if _slow_handler_threshold is not None and duration >= _slow_handler_threshold:
+        logger.warning("Slow handler {} took {:.3f}s".format(handler_name, duration))
@@ -1,8 +1,44 @@
 """
 Main entry point for the game bot
+
+Run with --import-time to print where the import time of the bot goes,
+like python -X importtime, instead of starting it.
 """
 
-from game_bot.bot import main
+import os
+import sys
+import time
+
+STARTED_AT = time.perf_counter()
+
+
+def report_import_time(top: int = 25):
+    """Import the bot under -X importtime in a child process and summarise the report"""
+    import subprocess
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import game_bot.bot"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "self [us]" not in line:
+            self_us, cumulative_us, module = line[len("import time:"):].split("|")
+            rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+        elif result.returncode != 0:
+            print(line)
+    if result.returncode != 0:
+        sys.exit(result.returncode)
+
+    print("Importing game_bot.bot took {:.1f} ms\n".format(sum(row[1] for row in rows) / 1000))
+    print("{:>10} {:>10}  module".format("cumul ms", "self ms"))
+    for cumulative_us, self_us, module in sorted(rows, reverse=True)[:top]:
+        print("{:>10.1f} {:>10.1f} {}".format(cumulative_us / 1000, self_us / 1000, module))
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--import-time" in sys.argv[1:]:
+        report_import_time()
+    else:
+        from game_bot.bot import main
+        main(started_at=STARTED_AT)
@@ -0,0 +1,108 @@
+"""
+Tests for the retry and stale response fallback of the async gRPC client
+"""
+
+import asyncio
+import os
+import sys
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+grpc = pytest.importorskip("grpc")
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_bot import grpc_client
+from game_bot.resilience import CircuitBreaker
+
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code: grpc.StatusCode):
+        self._code = code
+
+    def code(self) -> grpc.StatusCode:
+        return self._code
+
+    def details(self) -> str:
+        return self._code.name
+
+
+class FakeRequest:
+    def __init__(self, payload: bytes = b"request"):
+        self.payload = payload
+
+    def SerializeToString(self) -> bytes:
+        return self.payload
+
+
+class FakeStub:
+    """Answers every RPC with the next of the given outcomes, raising the exceptions"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __getattr__(self, method):
+        async def call(request, timeout=None, metadata=None):
+            self.calls += 1
+            outcome = self.outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        return call
+
+
+def make_client(stub: FakeStub) -> grpc_client.AsyncGameServiceClient:
+    # Skip __init__, it needs the generated proto modules and a backend
+    client = grpc_client.AsyncGameServiceClient.__new__(grpc_client.AsyncGameServiceClient)
+    client.channel_pool = SimpleNamespace(next_stub=lambda: stub)
+    client.circuit_breaker = CircuitBreaker(failure_threshold=100, reset_timeout=30)
+    client._stale_responses = OrderedDict()
+    return client
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(grpc_client, "RETRY_INITIAL_BACKOFF", 0)
+    monkeypatch.setattr(grpc_client, "RETRY_MAX_BACKOFF", 0)
+
+
+def test_transient_read_failure_serves_cached_response():
+    unavailable = FakeRpcError(grpc.StatusCode.UNAVAILABLE)
+    stub = FakeStub("fresh", unavailable, unavailable, unavailable)
+    client = make_client(stub)
+
+    assert asyncio.run(client._call("GetAllPacks", FakeRequest())) == "fresh"
+    assert asyncio.run(client._call("GetAllPacks", FakeRequest())) == "fresh"
+    assert stub.calls == 1 + grpc_client.RETRY_MAX_ATTEMPTS
+
+
+def test_non_transient_read_failure_raises_despite_cached_response():
+    stub = FakeStub("fresh", FakeRpcError(grpc.StatusCode.NOT_FOUND))
+    client = make_client(stub)
+
+    asyncio.run(client._call("GetAllPacks", FakeRequest()))
+    with pytest.raises(grpc.RpcError) as error:
+        asyncio.run(client._call("GetAllPacks", FakeRequest()))
+    assert error.value.code() == grpc.StatusCode.NOT_FOUND
+
+
+def test_transient_read_failure_without_cached_response_raises():
+    unavailable = FakeRpcError(grpc.StatusCode.UNAVAILABLE)
+    client = make_client(FakeStub(*[unavailable] * grpc_client.RETRY_MAX_ATTEMPTS))
+
+    with pytest.raises(grpc.RpcError) as error:
+        asyncio.run(client._call("GetAllPacks", FakeRequest(b"other")))
+    assert error.value.code() == grpc.StatusCode.UNAVAILABLE
+
+
+def test_write_failure_raises_without_retrying():
+    stub = FakeStub(FakeRpcError(grpc.StatusCode.UNAVAILABLE))
+    client = make_client(stub)
+
+    with pytest.raises(grpc.RpcError):
+        asyncio.run(client._call("SubmitAnswer", FakeRequest()))
+    assert stub.calls == 1
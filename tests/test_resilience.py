@@ -0,0 +1,76 @@
+"""
+Tests for the half-open state of the circuit breaker
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("grpc")
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_bot import resilience
+from game_bot.resilience import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def open_breaker(clock: FakeClock) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.allow_request()
+    clock.now += 30
+    return breaker
+
+
+def test_half_open_lets_a_single_trial_through(clock):
+    breaker = open_breaker(clock)
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+
+def test_failed_trial_reopens_the_circuit(clock):
+    breaker = open_breaker(clock)
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    clock.now += 30
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_abandoned_trial_is_replaced_after_reset_timeout(clock):
+    breaker = open_breaker(clock)
+
+    assert breaker.allow_request()
+    clock.now += 29
+    assert not breaker.allow_request()
+    clock.now += 1
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
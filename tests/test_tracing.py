@@ -0,0 +1,43 @@
+"""
+Tests for span creation and trace context propagation
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_bot import tracing
+
+
+@pytest.fixture(autouse=True)
+def tracing_disabled():
+    tracing.configure(None)
+    yield
+    tracing.configure(None)
+
+
+def test_disabled_tracing_creates_no_spans():
+    with tracing.start_span("handler", user_id=1) as span:
+        span.set_attribute("update_id", 2)
+        assert tracing.current_span() is None
+        assert tracing.grpc_metadata() == ()
+
+
+def test_enabled_tracing_exports_child_spans(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(tracing.JsonLinesExporter(str(path)))
+
+    with tracing.start_span("handler") as parent:
+        with tracing.start_span("grpc GetAllPacks") as child:
+            assert tracing.grpc_metadata() == (("traceparent", child.traceparent()),)
+    tracing.configure(None)
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [span["name"] for span in spans] == ["grpc GetAllPacks", "handler"]
+    assert spans[0]["parentSpanId"] == parent.span_id
+    assert spans[0]["traceId"] == spans[1]["traceId"]